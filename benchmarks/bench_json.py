@@ -0,0 +1,51 @@
+"""Encode/decode throughput of the installed json codecs by payload size.
+
+Usage: python benchmarks/bench_json.py
+"""
+import timeit
+
+from mock_services.json_codec import CODECS
+
+
+SIZES = [1, 10, 100, 1000, 10000]
+
+
+def make_payload(size):
+    return [
+        {
+            'id': i,
+            'uuid': '6f1c2a7e-7d4e-4f59-9f39-{0:012d}'.format(i),
+            'name': 'resource {0}'.format(i),
+            'active': i % 2 == 0,
+            'score': i / 3.0,
+            'tags': ['a', 'b', 'c'],
+        }
+        for i in range(size)
+    ]
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    print('{0:<8} {1:>6} {2:>14} {3:>14}'.format(
+        'codec', 'items', 'encode MB/s', 'decode MB/s'))
+
+    for size in SIZES:
+        payload = make_payload(size)
+        number = max(1, 10000 // size)
+
+        for name, codec in sorted(CODECS.items()):
+            text = codec.dumps(payload)
+            megabytes = len(text.encode('utf-8')) / 1e6
+
+            encode = bench(lambda: codec.dumps(payload), number)
+            decode = bench(lambda: codec.loads(text), number)
+
+            print('{0:<8} {1:>6} {2:>14.1f} {3:>14.1f}'.format(
+                name, size, megabytes / encode, megabytes / decode))
+
+
+if __name__ == '__main__':
+    main()
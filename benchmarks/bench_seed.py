@@ -0,0 +1,33 @@
+"""Bulk seeding time of 1M resources, with and without new ids.
+
+Usage: python benchmarks/bench_seed.py
+"""
+import time
+
+from mock_services import storage
+from mock_services.service import ResourceContext
+
+
+SIZE = 1000000
+
+
+def bench(label, **kwargs):
+    storage.reset()
+    ctx = ResourceContext(hostname='my_fake_service', resource='api')
+    items = ({'id': i, 'name': 'resource {0}'.format(i)}
+             for i in range(SIZE))
+
+    start = time.time()
+    count = storage.seed(ctx, items, **kwargs)
+    elapsed = time.time() - start
+
+    print('{0:<16} {1} items in {2:.2f}s'.format(label, count, elapsed))
+
+
+def main():
+    bench('given ids')
+    bench('new int ids', id_factory=int)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Requests per second of the HTTP server, on keep-alive connections.
+
+Usage: python benchmarks/bench_server.py
+"""
+import asyncio
+import time
+
+from mock_services import storage
+from mock_services import update_rest_rules
+from mock_services.server import create_server
+from mock_services.service import ResourceContext
+
+
+CONNECTIONS = 10
+REQUESTS = 2000
+
+REQUEST = b'GET /api/1 HTTP/1.1\r\nHost: my_fake_service\r\n\r\n'
+
+
+async def client(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for _ in range(REQUESTS):
+        writer.write(REQUEST)
+        await reader.readuntil(b'\r\n\r\n')
+        await reader.readexactly(len(b'{"id": 1}'))
+    writer.close()
+
+
+async def bench():
+    server = await create_server(port=0)
+    port = server.sockets[0].getsockname()[1]
+
+    start = time.time()
+    await asyncio.gather(*[client(port) for _ in range(CONNECTIONS)])
+    elapsed = time.time() - start
+
+    server.close()
+    print('{0} requests in {1:.2f}s: {2:.0f} req/s'.format(
+        CONNECTIONS * REQUESTS, elapsed, CONNECTIONS * REQUESTS / elapsed))
+
+
+def main():
+    update_rest_rules([{
+        'method': 'GET',
+        'url': r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+    }])
+    storage.add(ResourceContext(hostname='my_fake_service', resource='api',
+                                id=1), {'id': 1})
+    asyncio.run(bench())
+
+
+if __name__ == '__main__':
+    main()
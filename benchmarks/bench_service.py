@@ -0,0 +1,48 @@
+"""Per-request overhead of the service layer with debug logs off and on.
+
+Usage: python benchmarks/bench_service.py
+"""
+import json
+import logging
+import timeit
+
+import attr
+import requests
+
+from mock_services import service
+
+
+URL = r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$'
+NUMBER = 20000
+
+
+def bench(label, func):
+    elapsed = min(timeit.repeat(func, number=NUMBER, repeat=3))
+    print('{0:<30} {1:8.2f} us/request'.format(
+        label, elapsed / NUMBER * 1e6))
+
+
+def main():
+    request = requests.Request(
+        'PUT', 'http://my_fake_service/api/1',
+        data=json.dumps({'foo': True, 'bar': 'baz'}),
+    ).prepare()
+    route = service.compile_route(URL)
+    validator = service.make_validator({'foo': attr.ib(), 'bar': attr.ib()})
+
+    def handle():
+        service.parse_url(request, route, require_id=True)
+        service.validate_data(request, attrs=validator)
+
+    logger = logging.getLogger('mock_services')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    for level, label in [(logging.INFO, 'debug disabled'),
+                         (logging.DEBUG, 'debug enabled')]:
+        logger.setLevel(level)
+        bench(label, handle)
+
+
+if __name__ == '__main__':
+    main()
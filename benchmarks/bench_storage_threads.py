@@ -0,0 +1,55 @@
+"""Concurrent storage throughput from 1 to 32 threads.
+
+Usage: python benchmarks/bench_storage_threads.py
+"""
+import threading
+import time
+
+from mock_services import storage
+from mock_services.exceptions import Http409
+from mock_services.service import ResourceContext
+
+
+OPERATIONS = 20000
+RESOURCES = 16
+
+
+def worker(index, operations):
+    for i in range(operations):
+        ctx = ResourceContext(hostname='my_fake_service',
+                              resource='api{0}'.format(i % RESOURCES),
+                              id='{0}-{1}'.format(index, i))
+        try:
+            storage.add(ctx, {'id': ctx.id})
+        except Http409:
+            pass
+        storage.update(ctx, {'foo': i})
+        storage.get(ctx)
+        storage.remove(ctx)
+
+
+def bench(threads_count):
+    storage.reset()
+    operations = OPERATIONS // threads_count
+    threads = [threading.Thread(target=worker, args=(i, operations))
+               for i in range(threads_count)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    print('{0:>2} threads {1:10.0f} ops/s'.format(
+        threads_count, operations * threads_count * 4 / elapsed))
+
+
+def main():
+    storage.set_concurrent(True)
+    for threads_count in [1, 2, 4, 8, 16, 32]:
+        bench(threads_count)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,16 @@ from .helpers import is_http_mock_started
 from .helpers import start_http_mock
 from .helpers import stop_http_mock
 
+from .json_codec import set_json_codec
+
+from .loaders import load_rules_file
+
+from .rules import load_rules
 from .rules import update_http_rules
 from .rules import update_rest_rules
 from .rules import reset_rules
+from .rules import restore_rules
+from .rules import snapshot_rules
 
 
 __all__ = [
@@ -21,7 +28,14 @@ __all__ = [
     'start_http_mock',
     'stop_http_mock',
 
+    'set_json_codec',
+
+    'load_rules_file',
+
+    'load_rules',
     'reset_rules',
+    'restore_rules',
+    'snapshot_rules',
     'update_http_rules',
     'update_rest_rules',
 ]
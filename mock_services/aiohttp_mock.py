@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""aiohttp connector answering with the registered rules::
+
+    >>> from mock_services.aiohttp_mock import MockConnector
+
+    >>> session = aiohttp.ClientSession(connector=MockConnector())
+
+Connections are in memory pipes to the HTTP server protocol, so responses
+are read by aiohttp as from a real service. Requests no rule matches raise
+`aiohttp.ServerDisconnectedError`, as a `aiohttp.ClientConnectionError`.
+"""
+import asyncio
+
+import aiohttp
+
+from aiohttp.client_proto import ResponseHandler
+
+from .server import HttpProtocol
+
+
+class PipeTransport(asyncio.Transport):
+    """In memory transport, data written is received by the `peer` one."""
+
+    def __init__(self, loop, protocol):
+        super(PipeTransport, self).__init__()
+        self.peer = None
+        self._loop = loop
+        self._protocol = protocol
+        self._closing = False
+
+    def _receive(self, data):
+        if not self._closing:
+            self._protocol.data_received(data)
+
+    def abort(self):
+        self.close()
+
+    def can_write_eof(self):
+        return False
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.call_soon(self._protocol.connection_lost, None)
+        self.peer.close()
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def get_protocol(self):
+        return self._protocol
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self._closing
+
+    def is_reading(self):
+        return not self._closing
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def set_protocol(self, protocol):
+        self._protocol = protocol
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def write(self, data):
+        # received on next loop iteration, as from a socket
+        if not self._closing:
+            self._loop.call_soon(self.peer._receive, bytes(data))
+
+
+def connect_pipe(loop, client, server):
+    """Connects the `client` and `server` protocols."""
+    client_transport = PipeTransport(loop, client)
+    server_transport = PipeTransport(loop, server)
+    client_transport.peer = server_transport
+    server_transport.peer = client_transport
+
+    server.connection_made(server_transport)
+    client.connection_made(client_transport)
+
+
+class MockConnector(aiohttp.BaseConnector):
+    """Connector to the registered rules, whatever the url scheme.
+
+    Rules are run in the event loop thread, or in the `executor` when given,
+    cf. `HttpProtocol`.
+    """
+
+    def __init__(self, keep_history=True, executor=None, **kwargs):
+        super(MockConnector, self).__init__(**kwargs)
+        self.keep_history = keep_history
+        self.executor = executor
+
+    async def _create_connection(self, req, traces, timeout):
+        loop = asyncio.get_event_loop()
+        protocol = ResponseHandler(loop)
+        connect_pipe(loop, protocol, HttpProtocol(
+            base_url=str(req.url.origin()),
+            keep_history=self.keep_history,
+            refuse_unknown=True,
+            executor=self.executor,
+        ))
+        return protocol
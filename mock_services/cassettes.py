@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Record real responses into cassettes and replay them as rules.
+
+A cassette file holds one JSON record by response, followed by an index of
+fixed size entries sorted by request key, and a footer locating the index::
+
+    MSCASSETTE1\\n
+    {"method": "GET", "url": "https://...", "status_code": 200, ...}\\n
+    ...
+    <key digest (8 bytes)><record offset (8 bytes)> * count
+    <index offset (8 bytes)><count (8 bytes)>
+
+Replayed cassettes are memory mapped and searched in place, so loading one
+does not depend on its number of records.
+"""
+import base64
+import hashlib
+import json
+import logging
+import mmap
+import struct
+
+from contextlib import contextmanager
+from threading import Lock
+
+from requests_mock import create_response
+
+from . import http_mock
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MSCASSETTE1\n'
+
+ENTRY = struct.Struct('<8sQ')
+FOOTER = struct.Struct('<QQ')
+
+# body is recorded decoded
+SKIPPED_HEADERS = frozenset([
+    'content-encoding',
+    'content-length',
+    'transfer-encoding',
+])
+
+
+def get_key(method, url):
+    return hashlib.sha1(
+        '{0} {1}'.format(method.upper(), url).encode('utf-8')).digest()[:8]
+
+
+class Recorder(object):
+    """Writes the responses given to `record` to the `path` cassette."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._entries = []
+        self._lock = Lock()
+
+    def __call__(self, response):
+        self.record(response)
+
+    def record(self, response):
+        request = response.request
+
+        data = {
+            'method': request.method.upper(),
+            'url': request.url,
+            'status_code': response.status_code,
+            'reason': response.reason,
+            'headers': [[k, v] for k, v in response.headers.items()
+                        if k.lower() not in SKIPPED_HEADERS],
+        }
+        try:
+            data['text'] = response.content.decode('utf-8')
+        except UnicodeDecodeError:
+            data['content'] = base64.b64encode(
+                response.content).decode('ascii')
+
+        line = json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+        with self._lock:
+            self._entries.append((get_key(data['method'], data['url']),
+                                  self._file.tell()))
+            self._file.write(line + b'\n')
+
+    def close(self):
+        """Writes the index, records of the same request keep their order."""
+        with self._lock:
+            index_offset = self._file.tell()
+            for entry in sorted(self._entries):
+                self._file.write(ENTRY.pack(*entry))
+            self._file.write(FOOTER.pack(index_offset, len(self._entries)))
+            self._file.close()
+
+        logger.info('%s responses recorded in %s', len(self._entries),
+                    self.path)
+
+
+@contextmanager
+def record(path):
+    """Sends the requests matching no rule to the network and records their
+    responses in the `path` cassette.
+    """
+    started = not http_mock.is_started()
+    if started:
+        http_mock.start()
+
+    recorder = Recorder(path)
+    allow_external = http_mock.get_allow_external()
+    http_mock.set_allow_external(True)
+    http_mock.set_recorder(recorder)
+    try:
+        yield recorder
+    finally:
+        http_mock.set_recorder(None)
+        http_mock.set_allow_external(allow_external)
+        recorder.close()
+        if started:
+            http_mock.stop()
+
+
+class Cassette(object):
+    """Rule answering with the recorded responses of its requests.
+
+    Responses recorded for the same request are replayed in order, the last
+    one is then repeated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        self._replayed = {}
+        self._lock = Lock()
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError('not a cassette: {0}'.format(path))
+
+        self._index_offset, self.count = FOOTER.unpack(
+            self._mmap[-FOOTER.size:])
+
+    def __call__(self, request):
+        key = (request.method, request.url)
+        records = self._records.get(key)
+        if records is None:
+            records = self.get_records(*key)
+            if not records:
+                # not cached, any request is tried
+                return None
+            self._records[key] = records
+
+        with self._lock:
+            position = self._replayed.get(key, 0)
+            self._replayed[key] = position + 1
+
+        data = records[min(position, len(records) - 1)]
+
+        if 'content' in data:
+            content = base64.b64decode(data['content'])
+        else:
+            content = data['text'].encode('utf-8')
+
+        return create_response(request, status_code=data['status_code'],
+                               reason=data['reason'],
+                               headers=dict(data['headers']),
+                               content=content)
+
+    def __repr__(self):
+        return 'Cassette({0!r})'.format(self.path)
+
+    def _get_entry(self, position):
+        offset = self._index_offset + position * ENTRY.size
+        return ENTRY.unpack(self._mmap[offset:offset + ENTRY.size])
+
+    def get_records(self, method, url):
+        """Returns the records of the `method` `url` request."""
+        key = get_key(method, url)
+
+        # first entry of the key
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        records = []
+        for position in range(low, self.count):
+            entry_key, offset = self._get_entry(position)
+            if entry_key != key:
+                break
+            end = self._mmap.find(b'\n', offset)
+            data = json.loads(self._mmap[offset:end].decode('utf-8'))
+            # key digest collision
+            if data['method'] == method.upper() and data['url'] == url:
+                records.append(data)
+        return records
+
+    def close(self):
+        self._mmap.close()
+
+
+def replay(path):
+    """Adds the `path` cassette as a rule and returns it."""
+    cassette = Cassette(path)
+    http_mock.add_matcher(cassette)
+    return cassette
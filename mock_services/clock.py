@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Clock of the simulated network conditions, real or virtual.
+
+The virtual clock advances instead of sleeping, so tests depending on delays
+run at full speed and give the same results on each run.
+"""
+import time
+
+from threading import Lock
+
+
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class Clock(object):
+
+    virtual = False
+
+    def __init__(self):
+        self._lock = Lock()
+        self._now = 0.0
+
+    def set_virtual(self, virtual=True, start=0.0):
+        """Switches to the virtual clock, starting at `start` seconds, or
+        back to the real one.
+        """
+        with self._lock:
+            self._now = float(start)
+            self.virtual = virtual
+
+    def is_virtual(self):
+        return self.virtual
+
+    def now(self):
+        """Returns the time in seconds, only to compare with other times."""
+        if self.virtual:
+            return self._now
+        return monotonic()
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            return
+        if not self.virtual:
+            time.sleep(seconds)
+            return
+        with self._lock:
+            self._now += seconds
+
+    def advance(self, seconds):
+        """Advances the virtual clock, ie. between two requests."""
+        if not self.virtual:
+            raise RuntimeError('the real clock can not be advanced')
+        self.sleep(seconds)
+
+
+_clock = Clock()
+
+__all__ = []
+
+# expose clock instance public methods
+for __attr in [a for a in dir(_clock) if not a.startswith('_')
+               and callable(getattr(_clock, a))]:
+    __all__.append(__attr)
+    globals()[__attr] = getattr(_clock, __attr)
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
-import json
 import logging
 
 from functools import wraps
 
+from . import metrics
 from .exceptions import Http400
 from .exceptions import Http401
 from .exceptions import Http403
@@ -13,6 +13,8 @@ from .exceptions import Http409
 from .exceptions import Http500
 from .helpers import start_http_mock
 from .helpers import stop_http_mock
+from .json_codec import Encoded
+from .json_codec import get_codec
 
 
 logger = logging.getLogger(__name__)
@@ -42,6 +44,7 @@ def with_http_mock(f):
 def trap_errors(f):
     @wraps(f)
     def wrapped(request, context, *args, **kwargs):
+        start = metrics._metrics.enabled and metrics.timer()
         try:
             return f(request, context, *args, **kwargs)
         except Http400:
@@ -66,6 +69,9 @@ def trap_errors(f):
             logger.exception(e)
             context.status_code = 500
             return 'Internal Server Error'
+        finally:
+            if start:
+                metrics.observe('callback', metrics.timer() - start)
     return wrapped
 
 
@@ -76,5 +82,11 @@ def to_json(f):
         # traped error are not json by default
         if context.status_code >= 400:
             data = {'error': data}
-        return json.dumps(data)
+        elif isinstance(data, Encoded):
+            return data.content
+        start = metrics._metrics.enabled and metrics.timer()
+        body = get_codec(kwargs.get('codec')).encode(data)
+        if start:
+            metrics.observe('serialize', metrics.timer() - start)
+        return body
     return wrapped
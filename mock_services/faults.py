@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Faults injected in REST rules responses, cf. rules `faults` option.
+
+Faults are scheduled with a `probability` or `every` Nth request, drawn from
+a seeded `random.Random` or counted without lock. Counts are restarted by
+`restore_rules`.
+"""
+import itertools
+import random
+import weakref
+
+try:
+    from http.client import IncompleteRead
+    from http.client import responses
+except ImportError:
+    # Python 2
+    from httplib import IncompleteRead
+    from httplib import responses
+
+import attr
+
+from requests.exceptions import ConnectionError
+
+from . import latency
+from .json_codec import get_codec
+from .streams import IterStream
+from .streams import as_body
+
+
+# seeded by `seed`
+_random = random.Random()
+
+# faults of the registered rules, restarted by `reset`
+_faults = weakref.WeakSet()
+
+
+def seed(seed):
+    """Seeds the faults probabilities, to inject them the same way on each
+    run.
+    """
+    _random.seed(seed)
+
+
+def reset():
+    """Restarts the `every` Nth request counts of the faults, ie. once rules
+    are restored.
+    """
+    for fault in list(_faults):
+        fault.reset_counter()
+
+
+# hashed by identity, to be kept in `_faults`
+@attr.s(slots=True, eq=False)
+class Fault(object):
+    """Fault injected with a `probability` or `every` Nth request.
+
+    It delays the response by `delay` seconds, then resets the connection,
+    answers with `status_code` and `headers`, or truncates the body to its
+    first `truncate` bytes. Delays only apply to `requests` responses, cf.
+    `latency`.
+    """
+
+    probability = attr.ib(default=None)
+    every = attr.ib(default=None)
+
+    delay = attr.ib(default=None)
+    reset = attr.ib(default=False)
+    status_code = attr.ib(default=None)
+    headers = attr.ib(default=attr.Factory(dict))
+    truncate = attr.ib(default=None)
+
+    _counter = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        if (self.probability is None) == (self.every is None):
+            raise ValueError('fault requires either probability or every')
+        if not (self.delay or self.reset or self.status_code
+                or self.truncate is not None):
+            raise ValueError('fault requires delay, reset, status_code or '
+                             'truncate')
+
+        self.reset_counter()
+        _faults.add(self)
+
+    def reset_counter(self):
+        self._counter = itertools.count(1)
+
+    def is_scheduled(self):
+        if self.probability is not None:
+            return _random.random() < self.probability
+        # count increments are atomic
+        return next(self._counter) % self.every == 0
+
+    def apply(self, callback, request, context, codec=None):
+        if self.delay:
+            latency.add_delay(request, self.delay)
+
+        if self.reset:
+            raise ConnectionError('Connection reset by peer: {0} {1}'.format(
+                request.method, request.url), request=request)
+
+        if self.status_code:
+            context.status_code = self.status_code
+            context.headers.update(self.headers)
+            return get_codec(codec).encode(
+                {'error': responses.get(self.status_code, '')})
+
+        body = callback(request, context)
+        if self.truncate is None or not isinstance(body, (bytes, type(u''))):
+            return body
+
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        context.headers['Content-Length'] = str(len(body))
+        return IterStream(_truncated(body, self.truncate))
+
+
+def _truncated(body, size):
+    # read as a connection closed before the end of the body
+    yield body[:size]
+    raise IncompleteRead(body[:size], len(body) - size)
+
+
+def make_fault(fault):
+    if isinstance(fault, Fault):
+        return fault
+    return Fault(**fault)
+
+
+def inject(callback, faults, codec=None, body='text'):
+    """Returns the `callback` answering with the first scheduled fault, as
+    the `body` rule argument.
+
+    Truncated bodies are streamed, `body` must then be "body".
+    """
+    faults = [make_fault(fault) for fault in faults]
+
+    def wrapped(request, context):
+        # every schedule counts each request
+        scheduled = None
+        for fault in faults:
+            if fault.is_scheduled() and scheduled is None:
+                scheduled = fault
+
+        if scheduled is not None:
+            data = scheduled.apply(callback, request, context, codec=codec)
+        else:
+            data = callback(request, context)
+
+        if isinstance(data, (bytes, type(u''))):
+            return as_body(data, body)
+        return data
+
+    return wrapped
@@ -1,18 +1,351 @@
+import re
+import weakref
+
+from collections import defaultdict
+
 import requests
 from requests.exceptions import ConnectionError
+from requests.exceptions import ReadTimeout
+from requests.structures import CaseInsensitiveDict
 
 from requests_mock import Adapter
 from requests_mock import MockerCore
+from requests_mock.adapter import ANY
 from requests_mock.exceptions import NoMockAddress
+from requests_mock.request import _RequestObjectProxy
+
+from . import clock
+from . import latency
+from . import metrics
+
+_unknown = object()
+
+# literal characters and escaped punctuation, ie. "\." or "\/", up to the
+# first metacharacter
+_LITERALS = re.compile(r'(?:[^\\.^$*+?{}\[\]|()]|\\[^0-9A-Za-z])*')
+_ESCAPED = re.compile(r'\\(.)')
+_QUANTIFIERS = '*+?{'
+
+# global inline flags the prefix would depend on
+_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux]*[imx][aiLmsux]*\)')
+
+
+def _scan_literals(pattern, start):
+    match = _LITERALS.match(pattern, start)
+    literals = match.group()
+
+    # a quantified literal is not part of the prefix
+    following = pattern[match.end():match.end() + 1]
+    if literals and following and following in _QUANTIFIERS:
+        literals = literals[:-1]
+        if (len(literals) - len(literals.rstrip('\\'))) % 2:
+            literals = literals[:-1]
+
+    if '\\' in literals:
+        literals = _ESCAPED.sub(r'\1', literals)
+    return literals
+
+
+def _has_alternation(pattern):
+    # "|" outside of any group or set
+    if '|' not in pattern:
+        return False
+
+    depth = 0
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == '\\':
+            position += 2
+            continue
+        if char == '[':
+            # first "]" of a set is literal
+            position += 1
+            if pattern[position:position + 1] == '^':
+                position += 1
+            if pattern[position:position + 1] == ']':
+                position += 1
+            end = position
+            while end < len(pattern) and pattern[end] != ']':
+                end += 2 if pattern[end] == '\\' else 1
+            position = end
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        position += 1
+    return False
+
+
+def get_url_prefix(url):
+    """Returns the literal hostname/path prefix every url matched by the
+    regex `url` starts with, or None if there is no such prefix.
+
+    The pattern is scanned, not compiled, up to its first metacharacter. The
+    prefix is cut on the last "/" so rules of the same host and path share
+    the same bucket.
+    """
+    if not hasattr(url, 'pattern'):
+        return None
+
+    # already known, cf. LazyRegex
+    prefix = getattr(url, 'url_prefix', _unknown)
+    if prefix is not _unknown:
+        return prefix
+
+    pattern = url.pattern
+    # text patterns only
+    if not hasattr(pattern, 'encode') \
+            or url.flags & (re.I | re.M | re.X) \
+            or _INLINE_FLAGS.search(pattern):
+        return None
+
+    if pattern.startswith('^'):
+        prefix = _scan_literals(pattern, 1)
+    elif pattern.startswith('\\A'):
+        prefix = _scan_literals(pattern, 2)
+    else:
+        return None
+
+    if _has_alternation(pattern):
+        return None
+
+    # at least the scheme is required
+    scheme_end = prefix.find('://')
+    if scheme_end < 0:
+        return None
+
+    path_end = prefix.rfind('/', scheme_end + 3)
+    if path_end < 0:
+        return prefix[:scheme_end + 3]
+    return prefix[:path_end + 1]
+
+
+class LazyRegex(object):
+    """Regex compiled on first use.
+
+    Its `url_prefix` can be given when known, cf. `get_url_prefix`.
+    """
+
+    def __init__(self, pattern, flags=0, url_prefix=_unknown):
+        self.pattern = pattern
+        self.flags = flags
+        self.url_prefix = url_prefix
+        self._regex = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.compile(), name)
+
+    def __repr__(self):
+        return 'LazyRegex({0!r})'.format(self.pattern)
+
+    def compile(self):
+        if self._regex is None:
+            self._regex = re.compile(self.pattern, self.flags)
+        return self._regex
+
+    def search(self, string, *args):
+        return self.compile().search(string, *args)
 
 
 class HttpAdapter(Adapter):
+    """Adapter dispatching requests through an index of its matchers.
+
+    Matchers are bucketed by method and by the literal prefix of their url,
+    those without any literal prefix go to a fallback list. Only the matchers
+    of the buckets a request url can hit are tried, still from the last
+    registered to the first one.
+
+    Matchers are indexed in one batch on the first request following their
+    registration.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(HttpAdapter, self).__init__(*args, **kwargs)
+        self._reset_index()
+
+    def _reset_index(self):
+        self._index = defaultdict(list)
+        self._indexed = 0
+        self._last_indexed = None
+        self._prefix_lengths = []
+
+    def _index_matcher(self, position, matcher):
+        method = getattr(matcher, '_method', ANY)
+        if method is not ANY:
+            method = method.upper()
+
+        prefix = get_url_prefix(getattr(matcher, '_url', None))
+        if prefix is not None and len(prefix) not in self._prefix_lengths:
+            self._prefix_lengths.append(len(prefix))
+            self._prefix_lengths.sort()
+
+        self._index[(method, prefix)].append((position, matcher))
+        self._indexed += 1
+        self._last_indexed = matcher
+
+    def _update_index(self):
+        # matchers list has been changed in place (cf. get_rules), ie. a rule
+        # popped then another one registered at the same position
+        if self._indexed > len(self._matchers) or (
+                self._indexed and self._matchers[self._indexed - 1]
+                is not self._last_indexed):
+            self._reset_index()
+
+        for position in range(self._indexed, len(self._matchers)):
+            self._index_matcher(position, self._matchers[position])
+
+    def _get_candidates(self, request):
+        method = request.method.upper()
+        url = request.url
+
+        buckets = []
+        for key in [(method, None), (ANY, None)] + [
+            (m, url[:length])
+            for length in self._prefix_lengths
+            for m in (method, ANY)
+        ]:
+            bucket = self._index.get(key)
+            if bucket:
+                buckets.append(bucket)
+
+        if len(buckets) == 1:
+            return [matcher for _, matcher in reversed(buckets[0])]
+
+        return [matcher for _, matcher in sorted(
+            (item for bucket in buckets for item in bucket),
+            reverse=True,
+        )]
+
+    def dispatch(self, method, url, headers=None, body=None,
+                 keep_history=True):
+        """Returns the response of the rules to a request not sent through
+        `requests`, ie. by the HTTP server or the async clients transports.
+
+        Raises `NoMockAddress` when no rule matches.
+
+        Without `keep_history`, the request is not kept in the adapter and
+        rule history, so it does not grow with the number of requests.
+        """
+        # already encoded, skip requests preparation
+        request = requests.PreparedRequest()
+        request.method = method.upper()
+        request.url = url
+        request.headers = CaseInsensitiveDict(headers or {})
+        request.body = body or None
+
+        request = _RequestObjectProxy(request,
+                                      case_sensitive=self._case_sensitive)
+        if keep_history:
+            self._add_to_history(request)
+
+        try:
+            return self._send(request)
+        finally:
+            if not keep_history:
+                self._forget(request)
+
+    def _forget(self, request):
+        # matchers add requests to their history when they answer, remove
+        # this very one, concurrent dispatches may have added others since
+        matcher = request._matcher and request._matcher()
+        history = getattr(matcher, 'request_history', None)
+        if history:
+            try:
+                history.remove(request)
+            except ValueError:
+                pass
 
     def get_rules(self):
         return self._matchers
 
+    def index_rules(self):
+        """Indexes the rules registered since the last request."""
+        self._update_index()
+
     def reset(self):
         self._matchers = []
+        self._reset_index()
+
+    def restore_rules(self, snapshot):
+        matchers, index, prefix_lengths = snapshot
+        self._matchers = list(matchers)
+        self._index = defaultdict(list, (
+            (key, list(bucket)) for key, bucket in index.items()
+        ))
+        self._indexed = len(matchers)
+        self._last_indexed = matchers[-1] if matchers else None
+        self._prefix_lengths = list(prefix_lengths)
+
+    def snapshot_rules(self):
+        self._update_index()
+        return (
+            tuple(self._matchers),
+            dict((key, tuple(bucket)) for key, bucket in self._index.items()),
+            tuple(self._prefix_lengths),
+        )
+
+    def send(self, request, **kwargs):
+        request = _RequestObjectProxy(request,
+                                      case_sensitive=self._case_sensitive,
+                                      **kwargs)
+        self._add_to_history(request)
+        return self._send(request)
+
+    def _send(self, request):
+        self._update_index()
+
+        if metrics._metrics.enabled:
+            return self._send_measured(request)
+
+        for matcher in self._get_candidates(request):
+            try:
+                resp = matcher(request)
+            except Exception:
+                request._matcher = weakref.ref(matcher)
+                raise
+
+            if resp is not None:
+                request._matcher = weakref.ref(matcher)
+                resp.connection = self
+                return resp
+
+        raise NoMockAddress(request)
+
+    def _send_measured(self, request):
+        # matching is timed apart from the response
+        start = metrics.timer()
+
+        for matcher in self._get_candidates(request):
+            # custom matchers, ie. cassettes, match when called
+            match = getattr(matcher, '_match', None)
+            if match is not None and not match(request):
+                continue
+
+            matched = metrics.timer()
+            try:
+                resp = matcher(request)
+            except Exception:
+                request._matcher = weakref.ref(matcher)
+                raise
+
+            if resp is None:
+                continue
+            request._matcher = weakref.ref(matcher)
+
+            metrics.observe('match', matched - start)
+            metrics.observe('response', metrics.timer() - matched)
+            metrics.hit(matcher)
+
+            resp.connection = self
+            return resp
+
+        metrics.miss(request.method, request.url)
+        raise NoMockAddress(request)
 
 
 _http_adapter = HttpAdapter()
@@ -24,6 +357,7 @@ class HttpMock(MockerCore):
         super(HttpMock, self).__init__(*args, **kwargs)
         self._adapter = _http_adapter
         self._http_last_send = None
+        self._recorder = None
 
     def is_started(self):
         # requests_mock > 1.1 allows nested mocking
@@ -40,14 +374,55 @@ class HttpMock(MockerCore):
 
         Will raise a ConnectionError otherwhise.
         """
-        self._real_http = allow
+        # renamed in requests_mock 1.4
+        self._real_http = self.real_http = allow
+
+    def get_allow_external(self):
+        return self.real_http
+
+    def set_recorder(self, recorder):
+        """Set the callable given the responses of external calls, or None.
+
+        cf. `cassettes.record`
+        """
+        self._recorder = recorder
+
+    def _delay(self, response, timeout=None, stream=False, **kwargs):
+        # simulated network, cf. latency
+        profile = latency.get_profile(response.request)
+        delay = latency.get_delay(response.request)
+        if profile is None and not delay:
+            return
+
+        # streamed bodies are not read yet, their chunks are delayed by the
+        # client reads
+        if stream:
+            size = 0
+            if profile is not None and profile.bandwidth:
+                response.raw._fp = latency.ThrottledStream(
+                    response.raw._fp, profile)
+        else:
+            size = len(response.content)
+
+        first_byte, transfer = latency.get_delays(profile, size)
+        first_byte += delay
+
+        if isinstance(timeout, tuple):
+            timeout = timeout[1]
+        if timeout is not None and first_byte > timeout:
+            clock.sleep(timeout)
+            raise ReadTimeout('Read timed out: {0} {1}'.format(
+                response.request.method, response.request.url),
+                request=response.request)
+
+        clock.sleep(first_byte + transfer)
 
     def _patch_last_send(self):
         self._http_last_send = requests.Session.send
 
         def _http_fake_send(session, request, **kwargs):
             try:
-                return self._http_last_send(session, request, **kwargs)
+                response = self._http_last_send(session, request, **kwargs)
             except NoMockAddress:
                 request = _http_adapter.last_request
                 error_msg = 'Connection refused: {0} {1}'.format(
@@ -58,6 +433,15 @@ class HttpMock(MockerCore):
                 response.request = request
                 raise response
 
+            if response.connection is _http_adapter:
+                self._delay(response, **kwargs)
+
+            # external call
+            elif self._recorder is not None:
+                self._recorder(response)
+
+            return response
+
         requests.Session.send = _http_fake_send
 
     def start(self):
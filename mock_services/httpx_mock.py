@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""httpx transports answering with the registered rules::
+
+    >>> from mock_services.httpx_mock import AsyncMockTransport
+    >>> from mock_services.httpx_mock import MockTransport
+
+    >>> client = httpx.Client(transport=MockTransport())
+    >>> async_client = httpx.AsyncClient(transport=AsyncMockTransport())
+
+Requests no rule matches raise `httpx.ConnectError`, or are sent with the
+`passthrough` transport when given.
+"""
+import asyncio
+import functools
+
+import httpx
+
+from requests.exceptions import ConnectionError
+from requests_mock.exceptions import NoMockAddress
+
+from . import http_mock
+
+
+def _dispatch(request, body):
+    try:
+        response = http_mock.dispatch(request.method, str(request.url),
+                                      headers=dict(request.headers.items()),
+                                      body=body)
+    except NoMockAddress:
+        return None
+    except ConnectionError as e:
+        raise httpx.ConnectError(str(e), request=request)
+
+    return httpx.Response(
+        response.status_code,
+        headers=list(response.headers.items()),
+        content=response.content or b'',
+        request=request,
+    )
+
+
+def _refused(request):
+    return httpx.ConnectError('Connection refused: {0} {1}'.format(
+        request.method, request.url), request=request)
+
+
+class MockTransport(httpx.BaseTransport):
+
+    def __init__(self, passthrough=None):
+        self.passthrough = passthrough
+
+    def handle_request(self, request):
+        response = _dispatch(request, request.read())
+        if response is not None:
+            return response
+        if self.passthrough is not None:
+            return self.passthrough.handle_request(request)
+        raise _refused(request)
+
+
+class AsyncMockTransport(httpx.AsyncBaseTransport):
+    """Rules are run in the event loop thread, as the in memory storage never
+    waits. With a storage backend doing IO, give an `executor` to run them
+    in, and make the storage concurrent.
+    """
+
+    def __init__(self, passthrough=None, executor=None):
+        self.passthrough = passthrough
+        self.executor = executor
+
+    async def handle_async_request(self, request):
+        body = await request.aread()
+
+        if self.executor is None:
+            response = _dispatch(request, body)
+        else:
+            response = await asyncio.get_event_loop().run_in_executor(
+                self.executor, functools.partial(_dispatch, request, body))
+
+        if response is not None:
+            return response
+        if self.passthrough is not None:
+            return await self.passthrough.handle_async_request(request)
+        raise _refused(request)
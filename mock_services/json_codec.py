@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""JSON codecs used to encode responses and decode requests bodies.
+
+Faster backends are used when installed: ``orjson`` or ``ujson``.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+import attr
+
+
+@attr.s(frozen=True)
+class Codec(object):
+    name = attr.ib()
+    dumps = attr.ib()
+    loads = attr.ib()
+    # encodes to bytes, defaults to `dumps` encoded in UTF-8
+    dumpb = attr.ib(default=None)
+
+    def encode(self, obj):
+        """Returns `obj` encoded to JSON bytes."""
+        if self.dumpb is not None:
+            return self.dumpb(obj)
+        return self.dumps(obj).encode('utf-8')
+
+
+@attr.s(frozen=True, slots=True)
+class Encoded(object):
+    """Already encoded json bytes, returned as is by `to_json`."""
+    content = attr.ib()
+
+
+CODECS = {
+    'json': Codec('json', json.dumps, json.loads),
+}
+
+if orjson is not None:
+    CODECS['orjson'] = Codec(
+        'orjson',
+        lambda obj: orjson.dumps(
+            obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8'),
+        orjson.loads,
+        lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+    )
+
+if ujson is not None:
+    CODECS['ujson'] = Codec('ujson', ujson.dumps, ujson.loads)
+
+
+_codec = CODECS['json']
+
+
+def get_codec(name=None):
+    """Returns the `name` codec, or the global one if None."""
+    if name is None:
+        return _codec
+    if isinstance(name, Codec):
+        return name
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError('unknown json codec: {0}'.format(name))
+
+
+def set_json_codec(name):
+    """Set the global codec: "json", "orjson", "ujson" or "fastest" to pick
+    the fastest one installed.
+    """
+    global _codec
+    if name == 'fastest':
+        name = next(n for n in ['orjson', 'ujson', 'json'] if n in CODECS)
+    _codec = get_codec(name)
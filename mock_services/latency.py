@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Simulated latency, jitter and bandwidth of the mocked services.
+
+Profiles are set by host, or by rule with the `latency` option, and applied
+once the response is built, outside of any lock, so concurrent requests are
+delayed concurrently. Delays are slept on the `clock`, which can be virtual.
+
+Streamed bodies are throttled as they are read, chunk by chunk.
+
+Only `requests` responses are delayed, the server, httpx and aiohttp paths
+answer without delay. Profiles are removed by `reset_rules`.
+"""
+import io
+import random
+import weakref
+
+from threading import Lock
+
+import attr
+
+from requests.compat import urlparse
+
+from . import clock
+
+
+@attr.s(frozen=True, slots=True)
+class Profile(object):
+    """Network conditions: `latency` and `jitter` in seconds before the first
+    byte, then `bandwidth` in bytes per second, unlimited when None.
+    """
+
+    latency = attr.ib(default=0.0)
+    jitter = attr.ib(default=0.0)
+    bandwidth = attr.ib(default=None)
+
+    def get_latency(self, rng):
+        if not self.jitter:
+            return self.latency
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def get_transfer(self, size):
+        if not self.bandwidth or not size:
+            return 0.0
+        return float(size) / self.bandwidth
+
+
+class ThrottledStream(io.RawIOBase):
+    """Raw body of a streamed response, read at the `profile` bandwidth."""
+
+    def __init__(self, raw, profile):
+        self._raw = raw
+        self._profile = profile
+
+    def close(self):
+        self._raw.close()
+        super(ThrottledStream, self).close()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._raw.read()
+        else:
+            data = self._raw.read(size)
+        clock.sleep(self._profile.get_transfer(len(data)))
+        return data
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def make_profile(profile):
+    if profile is None or isinstance(profile, Profile):
+        return profile
+    return Profile(**profile)
+
+
+class Latency(object):
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._hosts = {}
+            self._rules = weakref.WeakKeyDictionary()
+            self._random = random.Random()
+
+    def seed(self, seed):
+        """Seeds the jitter, to delay requests the same way on each run."""
+        with self._lock:
+            self._random.seed(seed)
+
+    def set_host_profile(self, hostname, profile=None, **kwargs):
+        """Sets the profile of the rules answering `hostname`, given as a
+        `Profile` or its attributes, or removes it.
+        """
+        profile = make_profile(profile or kwargs or None)
+        with self._lock:
+            if profile is None:
+                self._hosts.pop(hostname, None)
+            else:
+                self._hosts[hostname] = profile
+
+    def set_rule_profile(self, matcher, profile):
+        """Sets the profile of the `matcher` rule, taking precedence over its
+        host one. cf. rules `latency` option.
+        """
+        profile = make_profile(profile)
+        with self._lock:
+            if profile is None:
+                self._rules.pop(matcher, None)
+            else:
+                self._rules[matcher] = profile
+
+    def add_delay(self, request, seconds):
+        """Delays the response of the mocked `request` before its first byte,
+        ie. by a callback, without sleeping while requests-mock is locked.
+        """
+        request._mock_delay = self.get_delay(request) + seconds
+
+    def get_delay(self, request):
+        """Returns the delay added to the mocked `request` response."""
+        return getattr(request, '_mock_delay', 0.0)
+
+    def get_profile(self, request):
+        """Returns the profile of the mocked `request`, or None."""
+        if not self._hosts and not self._rules:
+            return None
+
+        if self._rules:
+            matcher = request._matcher and request._matcher()
+            profile = self._rules.get(matcher) \
+                if matcher is not None else None
+            if profile is not None:
+                return profile
+
+        if self._hosts:
+            return self._hosts.get(urlparse(request.url).hostname)
+
+    def get_delays(self, profile, size):
+        """Returns the time to the first byte and to transfer `size` bytes."""
+        if profile is None:
+            return 0.0, 0.0
+        with self._lock:
+            latency = profile.get_latency(self._random)
+        return latency, profile.get_transfer(size)
+
+
+_latency = Latency()
+
+__all__ = ['Profile', 'ThrottledStream']
+
+# expose latency instance public methods
+for __attr in [a for a in dir(_latency) if not a.startswith('_')
+               and callable(getattr(_latency, a))]:
+    __all__.append(__attr)
+    globals()[__attr] = getattr(_latency, __attr)
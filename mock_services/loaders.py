@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Load rules from YAML or JSON files.
+
+Rules file example:
+
+.. code-block:: yaml
+
+    http:
+      - method: GET
+        url: ^https://duckduckgo\\.com/\\?q=
+        text: Coincoin!
+    rest:
+      - method: LIST
+        url: ^http://my_fake_service/(?P<resource>api)(\\?|$)
+        indexes: [email]
+      - method: POST
+        url: ^http://my_fake_service/(?P<resource>api)$
+        id_factory: uuid
+        attrs:
+          email: {}
+          active: {default: true}
+        validators:
+          - my_tests.validators:duplicate_email
+
+Once validated, rules and their routes metadata are written to a cache file
+reused while the rules file does not change.
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import attr
+
+from . import http_mock
+from . import rules
+from . import service
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+ID_FACTORIES = {
+    'int': int,
+    'uuid': uuid.UUID,
+}
+
+
+def load_rules_file(path, cache_path=None, cache=True):
+    """Adds the rules of the `path` YAML or JSON file.
+
+    The cache is written to `cache_path`, next to the rules file by default.
+
+    Returns a `LoadReport`, cf. `load_rules`.
+    """
+    data = read_rules_file(path, cache_path=cache_path, cache=cache)
+    return rules.load_rules(
+        http_rules=(_http_rule(kw) for kw in data['http']),
+        rest_rules=(_rest_rule(kw) for kw in data['rest']),
+    )
+
+
+def read_rules_file(path, cache_path=None, cache=True):
+    """Returns the validated rules of the `path` file, from its cache when
+    it is up to date.
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    digest = hashlib.sha1(source).hexdigest()
+    cache_path = cache_path or path + '.cache'
+
+    if cache:
+        data = _read_cache(cache_path, digest)
+        if data is not None:
+            logger.debug('rules read from cache: %s', cache_path)
+            return data
+
+    data = validate_rules(_parse(path, source))
+
+    if cache:
+        _write_cache(cache_path, digest, data)
+
+    return data
+
+
+def validate_rules(data):
+    """Checks `data` rules and adds each one its route metadata."""
+    if not isinstance(data, dict) or set(data) - set(['http', 'rest']):
+        raise ValueError('rules file must only have "http" and "rest" lists')
+
+    validated = {}
+
+    for name in ['http', 'rest']:
+        validated[name] = []
+
+        for kw in data.get(name) or []:
+
+            if not isinstance(kw, dict) or 'method' not in kw \
+                    or 'url' not in kw:
+                raise ValueError('invalid rule: {0}'.format(kw))
+
+            if name == 'rest' and kw['method'] not in rules.METHODS:
+                raise NotImplementedError('invalid method "{method}" for: {url}'.format(**kw))  # noqa
+
+            route = service.compile_route(kw['url'])
+            validated[name].append(dict(kw, route={
+                'prefix': http_mock.get_url_prefix(route.regex),
+                'groups': sorted(route.groups),
+                'hostname': route.hostname,
+            }))
+
+    return validated
+
+
+def _parse(path, source):
+    if os.path.splitext(path)[1] in ['.yml', '.yaml']:
+        if yaml is None:
+            raise ImportError('PyYAML is required to read: {0}'.format(path))
+        return yaml.safe_load(source)
+    return json.loads(source.decode('utf-8'))
+
+
+def _read_cache(cache_path, digest):
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if cached.get('version') != CACHE_VERSION \
+            or cached.get('digest') != digest:
+        return None
+
+    return cached['rules']
+
+
+def _write_cache(cache_path, digest, data):
+    # written then renamed, cache can be shared between processes
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(cache_path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'version': CACHE_VERSION,
+                'digest': digest,
+                'rules': data,
+            }, f)
+        os.rename(tmp_path, cache_path)
+        tmp_path = None
+    # values JSON can not encode, ie. YAML dates, are loaded without cache
+    except (IOError, OSError, TypeError, ValueError) as e:
+        logger.warning('unable to write rules cache %s: %s', cache_path, e)
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def _lazy_regex(kw):
+    return http_mock.LazyRegex(kw['url'], url_prefix=kw['route']['prefix'])
+
+
+def _http_rule(kw):
+    kw = dict(kw, url=_lazy_regex(kw))
+    kw.pop('route')
+    return kw
+
+
+def _rest_rule(kw):
+    meta = kw['route']
+
+    kw = dict(kw, url=service.Route(
+        url=kw['url'],
+        regex=_lazy_regex(kw),
+        groups=frozenset(meta['groups']),
+        hostname=meta['hostname'],
+    ))
+    kw.pop('route')
+
+    if 'attrs' in kw:
+        attrs = kw['attrs']
+        if isinstance(attrs, list):
+            attrs = dict((name, {}) for name in attrs)
+        kw['attrs'] = dict((name, attr.ib(**(options or {})))
+                           for name, options in attrs.items())
+
+    if 'id_factory' in kw:
+        kw['id_factory'] = ID_FACTORIES.get(kw['id_factory'],
+                                            kw['id_factory'])
+
+    if 'validators' in kw:
+        kw['validators'] = [_import(path) for path in kw['validators']]
+
+    return kw
+
+
+def _import(path):
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Opt-in metrics of the mocked requests.
+
+When disabled, instrumented code only reads the `enabled` flag.
+"""
+import time
+
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# latency histograms buckets, in seconds
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# requests processing stages
+STAGES = [
+    'match',  # finding the rule
+    'response',  # building the response, callback included
+    'callback',  # REST callbacks, serialization excluded
+    'serialize',  # REST callbacks json encoding
+]
+
+
+def _rule_label(matcher):
+    url = getattr(matcher, '_url', None)
+    if url is None:
+        # custom matcher, ie. cassette
+        return ('ANY', repr(matcher))
+    return (
+        str(getattr(matcher, '_method', 'ANY')).upper(),
+        getattr(url, 'pattern', str(url)),
+    )
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        buckets = {}
+        cumulative = 0
+        for le, count in zip(BUCKETS + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(le)] = cumulative
+        return {'buckets': buckets, 'count': self.count, 'sum': self.sum}
+
+
+class Metrics(object):
+
+    enabled = False
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def is_enabled(self):
+        return self.enabled
+
+    def reset(self):
+        with self._lock:
+            self._hits = defaultdict(int)
+            self._misses = defaultdict(int)
+            self._storage = defaultdict(int)
+            self._latency = dict((stage, Histogram()) for stage in STAGES)
+
+    def hit(self, matcher):
+        label = _rule_label(matcher)
+        with self._lock:
+            self._hits[label] += 1
+
+    def miss(self, method, url):
+        # without query string, to bound the number of urls
+        label = (method.upper(), url.split('?', 1)[0])
+        with self._lock:
+            self._misses[label] += 1
+
+    def count_storage(self, operation):
+        with self._lock:
+            self._storage[operation] += 1
+
+    def observe(self, stage, duration):
+        with self._lock:
+            self._latency[stage].observe(duration)
+
+    def as_dict(self):
+        """Returns the metrics, rules and misses are keyed by "METHOD url"."""
+        with self._lock:
+            return {
+                'hits': dict(('{0} {1}'.format(*k), v)
+                             for k, v in self._hits.items()),
+                'misses': dict(('{0} {1}'.format(*k), v)
+                               for k, v in self._misses.items()),
+                'storage': dict(self._storage),
+                'latency': dict((stage, histogram.as_dict())
+                                for stage, histogram in self._latency.items()),
+            }
+
+    def to_prometheus(self):
+        """Returns the metrics in Prometheus text format."""
+        lines = []
+
+        def add(name, kind, help, samples):
+            lines.append('# HELP mock_services_{0} {1}'.format(name, help))
+            lines.append('# TYPE mock_services_{0} {1}'.format(name, kind))
+            for suffix, labels, value in samples:
+                lines.append('mock_services_{0}{1}{{{2}}} {3}'.format(
+                    name, suffix, ','.join(
+                        '{0}="{1}"'.format(k, _escape(v)) for k, v in labels),
+                    value))
+
+        with self._lock:
+            add('rule_hits_total', 'counter', 'Requests answered by rule.', [
+                ('', [('method', method), ('url', url)], count)
+                for (method, url), count in sorted(self._hits.items())
+            ])
+            add('misses_total', 'counter', 'Requests matching no rule.', [
+                ('', [('method', method), ('url', url)], count)
+                for (method, url), count in sorted(self._misses.items())
+            ])
+            add('storage_operations_total', 'counter',
+                'Storage operations by name.', [
+                    ('', [('operation', operation)], count)
+                    for operation, count in sorted(self._storage.items())
+                ])
+
+            samples = []
+            for stage in STAGES:
+                histogram = self._latency[stage].as_dict()
+                for le in [str(b) for b in BUCKETS] + ['+Inf']:
+                    samples.append(('_bucket', [('stage', stage), ('le', le)],
+                                    histogram['buckets'][le]))
+                samples.append(('_sum', [('stage', stage)], histogram['sum']))
+                samples.append(('_count', [('stage', stage)],
+                                histogram['count']))
+            add('latency_seconds', 'histogram',
+                'Requests processing time by stage.', samples)
+
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = Metrics()
+
+__all__ = []
+
+# expose metrics instance public methods
+for __attr in [a for a in dir(_metrics) if not a.startswith('_')
+               and callable(getattr(_metrics, a))]:
+    __all__.append(__attr)
+    globals()[__attr] = getattr(_metrics, __attr)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Rate limits of REST rules, by host or by resource, cf. rules `rate_limit`
+option.
+
+Token buckets are kept as their next token time (GCRA), on the `clock` used
+by the latency simulation. Rules are also run outside of the requests-mock
+lock, by the server and the async clients transports, so each bucket has its
+own lock.
+"""
+import math
+
+from threading import Lock
+
+import attr
+
+from . import clock
+from .exceptions import Http404
+from .json_codec import get_codec
+from .service import parse_url
+from .streams import as_body
+
+
+SCOPES = ['host', 'resource']
+
+
+@attr.s(slots=True)
+class TokenBucket(object):
+    """Bucket of `burst` tokens, refilled by `rate` tokens per second."""
+
+    rate = attr.ib()
+    burst = attr.ib(default=1)
+
+    allowed = attr.ib(default=0, init=False)
+    throttled = attr.ib(default=0, init=False)
+
+    _tat = attr.ib(default=None, init=False, repr=False)
+    _lock = attr.ib(init=False, repr=False, default=attr.Factory(Lock))
+
+    def __attrs_post_init__(self):
+        if self.rate <= 0 or self.burst < 1:
+            raise ValueError('rate limit requires a positive rate and burst')
+
+    def acquire(self):
+        """Takes a token, or returns the seconds to wait for the next one."""
+        interval = 1.0 / self.rate
+
+        with self._lock:
+            now = clock.now()
+            tat = now if self._tat is None else max(self._tat, now)
+
+            wait = tat + interval - self.burst * interval - now
+            if wait > 0:
+                self.throttled += 1
+                return wait
+
+            self._tat = tat + interval
+            self.allowed += 1
+            return 0
+
+    def get_counts(self):
+        """Returns the number of requests allowed and throttled."""
+        with self._lock:
+            return {'allowed': self.allowed, 'throttled': self.throttled}
+
+
+_buckets = {}
+
+
+def reset():
+    _buckets.clear()
+
+
+def get_bucket(key, rate, burst=1):
+    """Returns the `key` bucket, shared by the rules of the same scope and
+    limits.
+    """
+    bucket = _buckets.get((key, rate, burst))
+    if bucket is None:
+        bucket = _buckets.setdefault((key, rate, burst),
+                                     TokenBucket(rate, burst))
+    return bucket
+
+
+def get_counts():
+    """Returns the requests allowed and throttled by bucket key."""
+    return dict((key, bucket.get_counts())
+                for (key, _, _), bucket in _buckets.items())
+
+
+def limit_rate(callback, rate, burst=1, per='host', url=None, codec=None,
+               body='text'):
+    """Returns the `callback` answering 429 with a Retry-After header over
+    `rate` requests per second, by host or by resource of the `url` route.
+
+    Throttled responses are returned as the `body` rule argument.
+    """
+    if per not in SCOPES:
+        raise ValueError('invalid rate limit scope: {0}'.format(per))
+
+    # fail early on invalid limits
+    TokenBucket(rate, burst)
+
+    def wrapped(request, context):
+        if per == 'host':
+            key = request.hostname
+        else:
+            try:
+                key = parse_url(request, url).key
+            except Http404:
+                return callback(request, context)
+
+        wait = get_bucket(key, rate, burst).acquire()
+        if not wait:
+            return callback(request, context)
+
+        context.status_code = 429
+        context.headers['Retry-After'] = str(int(math.ceil(wait)))
+        return as_body(get_codec(codec).encode(
+            {'error': 'Too Many Requests'}), body)
+
+    return wrapped
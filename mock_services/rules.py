@@ -1,15 +1,24 @@
 # -*- coding: utf-8 -*-
 import logging
+import mimetypes
 import re
+import time
 
 from copy import deepcopy
 from functools import partial
 
+import attr
+
 from requests_mock.response import _BODY_ARGS
 
+from . import faults
 from . import http_mock
+from . import json_codec
+from . import latency
+from . import ratelimits
 from . import service
 from . import storage
+from . import streams
 
 
 logger = logging.getLogger(__name__)
@@ -27,9 +36,36 @@ METHODS = [
 
 def reset_rules():
     storage.reset()
+    latency.reset()
+    ratelimits.reset()
     http_mock.reset()
 
 
+@attr.s(frozen=True)
+class RulesSnapshot(object):
+    rules = attr.ib()
+    storage = attr.ib()
+
+
+def snapshot_rules():
+    """Returns the current rules and storage state, ie. once seeded in a
+    session fixture, to be restored before each test with `restore_rules`.
+    """
+    return RulesSnapshot(
+        rules=http_mock.snapshot_rules(),
+        storage=storage.snapshot(),
+    )
+
+
+def restore_rules(snapshot):
+    http_mock.restore_rules(snapshot.rules)
+    storage.restore(snapshot.storage)
+    # tokens and counts are not part of the snapshot, restored tests start
+    # from scratch
+    faults.reset()
+    ratelimits.reset()
+
+
 def update_http_rules(rules, content_type='text/plain'):
     """Adds rules to global http mock.
 
@@ -58,36 +94,124 @@ def update_http_rules(rules, content_type='text/plain'):
         },
     ]
 
+    Large bodies can be streamed from a `file` path, or from the chunks of a
+    `stream` callback, called as a `text` one:
+
+    >>> rules = [
+        {
+            'method': 'GET',
+            'file': 'tests/fixtures/export.csv',
+            'url': r'^https://my_service/export$'
+        },
+    ]
+
+    Responses can be delayed by a `latency` profile, cf. `latency.Profile`:
+
+    >>> rules = [
+        {
+            'method': 'GET',
+            'text': 'Coincoin!',
+            'url': r'^https://duckduckgo.com/?q=',
+            'latency': {'latency': 0.2, 'jitter': 0.05, 'bandwidth': 1024},
+        },
+    ]
     """
-    for kw in deepcopy(rules):
+    _register_http_rules(deepcopy(rules), content_type=content_type)
+
+
+def update_rest_rules(rules, content_type='application/json'):
+    _register_http_rules(list(_build_rest_rules(deepcopy(rules))),
+                         content_type=content_type)
+
+
+def _register_http_rules(rules, content_type='text/plain', lazy=False):
+
+    count = 0
+
+    for kw in rules:
+
+        default_content_type = content_type
 
-        kw['url'] = re.compile(kw['url'])
+        # streamed bodies
+        if 'file' in kw:
+            path = kw.pop('file')
+            kw['body'] = streams.file_body(path)
+            default_content_type = mimetypes.guess_type(path)[0] \
+                or content_type
+        elif callable(kw.get('stream')):
+            kw['body'] = streams.stream_body(kw.pop('stream'))
+
+        if hasattr(kw['url'], 'search'):
+            pass
+        elif lazy:
+            kw['url'] = http_mock.LazyRegex(kw['url'])
+        else:
+            kw['url'] = re.compile(kw['url'])
 
         # ensure headers dict for at least have a default content type
         if 'Content-Type' not in kw.get('headers', {}):
             kw['headers'] = dict(kw.get('headers', {}), **{
-                'Content-Type': content_type,
+                'Content-Type': default_content_type,
             })
 
         method = kw.pop('method')
         url = kw.pop('url')
+        profile = kw.pop('latency', None)
 
-        http_mock.register_uri(method, url, **kw)
+        matcher = http_mock.register_uri(method, url, **kw)
+        if profile is not None:
+            latency.set_rule_profile(matcher, profile)
+        count += 1
 
+    return count
 
-def update_rest_rules(rules, content_type='application/json'):
 
-    http_rules = []
+def _build_rest_rules(rules, lazy=False):
 
-    for kw in deepcopy(rules):
+    for kw in rules:
 
         if kw['method'] not in METHODS:
             raise NotImplementedError('invalid method "{method}" for: {url}'.format(**kw))  # noqa
 
+        # fail early on unknown codec
+        if kw.get('codec') is not None:
+            kw['codec'] = json_codec.get_codec(kw['codec'])
+
+        if isinstance(kw['url'], service.Route):
+            route = kw['url']
+            kw['url'] = route.regex
+        elif lazy:
+            # compiled on first match, by the rule or its callback
+            route = service.compile_route(kw['url'], lazy=True)
+            kw['url'] = route.regex
+        else:
+            route = service.compile_route(kw['url'])
+
+        rule_faults = kw.pop('faults', None)
+        rate_limit = kw.pop('rate_limit', None)
+
         # set callback if does not has one
         if not any(x for x in _BODY_ARGS if x in kw):
+            # encoded bytes, answered as is
+            body = 'content'
+            if kw['method'] in ['DELETE', 'HEAD']:
+                body = 'text'
             _cb = getattr(service, '{0}_cb'.format(kw['method'].lower()))
-            kw['text'] = partial(_cb, **kw.copy())
+            if kw['method'] == 'LIST' and kw.get('stream'):
+                body = 'body'
+                _cb = service.list_stream_cb
+            kw[body] = partial(_cb, **dict(
+                kw,
+                url=route,
+                attrs=service.make_validator(kw.get('attrs')),
+            ))
+
+        if rule_faults:
+            _inject_faults(kw, rule_faults)
+
+        # throttled requests are not faulted
+        if rate_limit:
+            _limit_rate(kw, rate_limit, route)
 
         # no content
         if kw['method'] in ['DELETE', 'HEAD'] \
@@ -102,11 +226,84 @@ def update_rest_rules(rules, content_type='application/json'):
 
         # clean extra kwargs
         kw.pop('attrs', None)
+        kw.pop('codec', None)
+        kw.pop('filters', None)
         kw.pop('id_name', None)
         kw.pop('id_factory', None)
+        kw.pop('indexes', None)
+        kw.pop('stream', None)
         kw.pop('validators', None)
 
-        # update http_rules
-        http_rules.append(kw)
+        yield kw
+
+
+def _pop_body_callback(kw, option):
+    body = next(x for x in _BODY_ARGS if x in kw)
+    if body not in ['text', 'content', 'body']:
+        raise ValueError('{0} requires a text, content or body rule'.format(
+            option))
+
+    callback = kw.pop(body)
+    if not callable(callback):
+        callback = partial(_constant, callback)
+    return callback, body
+
+
+def _inject_faults(kw, rule_faults):
+    rule_faults = [faults.make_fault(fault) for fault in rule_faults]
+
+    callback, body = _pop_body_callback(kw, 'faults')
+
+    # truncated bodies are streamed
+    if any(fault.truncate is not None for fault in rule_faults):
+        body = 'body'
+
+    kw[body] = faults.inject(callback, rule_faults, codec=kw.get('codec'),
+                             body=body)
+
+
+def _limit_rate(kw, rate_limit, route):
+    callback, body = _pop_body_callback(kw, 'rate_limit')
+
+    kw[body] = ratelimits.limit_rate(callback, url=route,
+                                     codec=kw.get('codec'), body=body,
+                                     **rate_limit)
+
+
+def _constant(value, request, context):
+    return value
+
+
+@attr.s
+class LoadReport(object):
+    count = attr.ib()
+    duration = attr.ib()
+
+
+def load_rules(http_rules=None, rest_rules=None,
+               http_content_type='text/plain',
+               rest_content_type='application/json'):
+    """Adds rules in bulk, ie. from generators of rules.
+
+    Unlike `update_http_rules` and `update_rest_rules`, rules are not deep
+    copied and their urls are compiled on first match. Rules are indexed
+    in one batch once loaded.
+
+    Returns a `LoadReport` with the number of rules loaded and the time it
+    took in seconds, indexing included.
+    """
+    start = time.time()
+
+    count = _register_http_rules(
+        (dict(kw) for kw in http_rules or []),
+        content_type=http_content_type, lazy=True)
+    count += _register_http_rules(
+        _build_rest_rules((dict(kw) for kw in rest_rules or []), lazy=True),
+        content_type=rest_content_type, lazy=True)
+
+    # urls literal prefixes are parsed now rather than on the first request
+    http_mock.index_rules()
 
-    update_http_rules(http_rules, content_type=content_type)
+    report = LoadReport(count=count, duration=time.time() - start)
+    logger.info('%s rules loaded in %.3fs', report.count, report.duration)
+    return report
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Standalone HTTP server answering with the registered rules.
+
+Requests urls are built from:
+
+- the request target when absolute, so the server can be used as a proxy:
+  ``HTTP_PROXY=http://127.0.0.1:8080``,
+- the server `base_url`,
+- the request ``Host`` header.
+
+Usage::
+
+    $ python -m mock_services.server --port 8080 rules.yml
+"""
+import argparse
+import asyncio
+import functools
+import logging
+
+from collections import deque
+
+from http.client import responses
+
+from requests.exceptions import ConnectionError
+from requests_mock.exceptions import NoMockAddress
+
+from . import http_mock
+
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADERS_SIZE = 65536
+
+# set by the server
+HOP_HEADERS = frozenset([
+    'connection',
+    'content-length',
+    'keep-alive',
+    'transfer-encoding',
+])
+
+
+class HttpProtocol(asyncio.Protocol):
+    """HTTP/1.1 connection, with keep-alive and pipelining.
+
+    Rules are run in the event loop thread, as the in memory storage never
+    waits. With a storage backend doing IO, give an `executor` to run them
+    in, and make the storage concurrent. Responses are still written in the
+    requests order.
+
+    Requests no rule matches get a 404 response, or the connection is closed
+    with `refuse_unknown`.
+    """
+
+    def __init__(self, base_url=None, keep_history=False,
+                 refuse_unknown=False, executor=None):
+        self.base_url = base_url and base_url.rstrip('/')
+        self.keep_history = keep_history
+        self.refuse_unknown = refuse_unknown
+        self.executor = executor
+        self.transport = None
+        self._buffer = bytearray()
+        # responses run in the executor, in requests order
+        self._pending = deque()
+        self._closing = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+    def data_received(self, data):
+        self._buffer += data
+        while self.transport is not None and not self._closing:
+            request = self._parse_request()
+            if request is None:
+                break
+            self._handle_request(*request)
+
+    def _parse_request(self):
+        end = self._buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self._buffer) > MAX_HEADERS_SIZE:
+                self._write_error(431, 'Request Header Fields Too Large')
+            return None
+
+        lines = bytes(self._buffer[:end]).decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+            headers = dict(line.split(':', 1) for line in lines[1:])
+        except ValueError:
+            self._write_error(400, 'Bad Request')
+            return None
+
+        headers = dict((k.strip(), v.strip()) for k, v in headers.items())
+        lower = dict((k.lower(), v) for k, v in headers.items())
+
+        if 'transfer-encoding' in lower:
+            self._write_error(501, 'Not Implemented')
+            return None
+
+        try:
+            length = int(lower.get('content-length', 0))
+        except ValueError:
+            self._write_error(400, 'Bad Request')
+            return None
+
+        if len(self._buffer) < end + 4 + length:
+            return None
+
+        body = bytes(self._buffer[end + 4:end + 4 + length])
+        del self._buffer[:end + 4 + length]
+
+        connection = lower.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+
+        return method, self._get_url(target, lower), headers, body, keep_alive
+
+    def _get_url(self, target, lower):
+        if target.startswith(('http://', 'https://')):
+            return target
+        if self.base_url:
+            return self.base_url + target
+        return 'http://{0}{1}'.format(lower.get('host', ''), target)
+
+    def _dispatch(self, method, url, headers, body):
+        response = http_mock.dispatch(method, url, headers=headers, body=body,
+                                      keep_history=self.keep_history)
+        # streamed bodies are read here, and may fail too
+        return response, response.content or b''
+
+    def _handle_request(self, method, url, headers, body, keep_alive):
+        if self.executor is None:
+            self._respond(method, url, keep_alive, functools.partial(
+                self._dispatch, method, url, headers, body))
+            return
+
+        future = asyncio.get_event_loop().run_in_executor(
+            self.executor, self._dispatch, method, url, headers, body)
+        self._then(future, lambda future: self._respond(
+            method, url, keep_alive, future.result))
+
+    def _then(self, future, callback):
+        self._pending.append((future, callback))
+        if len(self._pending) == 1:
+            future.add_done_callback(self._flush)
+
+    def _flush(self, future=None):
+        while self._pending and self._pending[0][0].done():
+            future, callback = self._pending.popleft()
+            callback(future)
+        if self._pending:
+            self._pending[0][0].add_done_callback(self._flush)
+
+    def _respond(self, method, url, keep_alive, get_result):
+        if self.transport is None:
+            return
+
+        try:
+            response, content = get_result()
+        except NoMockAddress:
+            if self.refuse_unknown:
+                self.transport.close()
+                self.transport = None
+                return
+            self._write(404, 'Not Found', {'Content-Type': 'text/plain'},
+                        'No mock address: {0} {1}'.format(
+                            method, url).encode('utf-8'), keep_alive)
+            return
+        except ConnectionError:
+            # as refused by the mocked service
+            self.transport.close()
+            self.transport = None
+            return
+        except Exception:
+            logger.exception('rule error: %s %s', method, url)
+            self._write_error(500, 'Internal Server Error', keep_alive)
+            return
+
+        reason = response.reason or responses.get(response.status_code, '')
+        self._write(response.status_code, reason,
+                    response.headers, b'' if method == 'HEAD' else content,
+                    keep_alive, length=len(content))
+
+    def _write_error(self, status, reason, keep_alive=False):
+        if not self._pending:
+            self._write(status, reason, {}, b'', keep_alive)
+            return
+
+        # after the pending responses
+        if not keep_alive:
+            self._closing = True
+        future = asyncio.get_event_loop().create_future()
+        future.set_result(None)
+        self._then(future, lambda future: self.transport and self._write(
+            status, reason, {}, b'', keep_alive))
+
+    def _write(self, status, reason, headers, content, keep_alive,
+               length=None):
+        lines = ['HTTP/1.1 {0} {1}'.format(status, reason)]
+        lines.extend('{0}: {1}'.format(k, v) for k, v in headers.items()
+                     if k.lower() not in HOP_HEADERS)
+        lines.append('Content-Length: {0}'.format(
+            len(content) if length is None else length))
+        lines.append('Connection: {0}'.format(
+            'keep-alive' if keep_alive else 'close'))
+
+        self.transport.write(
+            ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + content)
+
+        if not keep_alive:
+            self.transport.close()
+            self.transport = None
+
+
+async def create_server(host='127.0.0.1', port=8080, base_url=None,
+                        keep_history=False, refuse_unknown=False,
+                        executor=None, **kwargs):
+    """Creates the server in the running loop, cf. `HttpProtocol`.
+
+    `kwargs` are given to `loop.create_server`, ie. `reuse_port` to run
+    a server process by core.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.create_server(
+        lambda: HttpProtocol(base_url=base_url, keep_history=keep_history,
+                             refuse_unknown=refuse_unknown,
+                             executor=executor),
+        host, port, **kwargs)
+
+
+def serve(host='127.0.0.1', port=8080, base_url=None, refuse_unknown=False,
+          **kwargs):
+    """Serves the registered rules until interrupted."""
+
+    async def run():
+        server = await create_server(host=host, port=port,
+                                     base_url=base_url,
+                                     refuse_unknown=refuse_unknown, **kwargs)
+        logger.info('serving rules on http://%s:%s', host, port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main(args=None):
+    from .loaders import load_rules_file
+
+    parser = argparse.ArgumentParser(
+        description='Serve mock-services rules over HTTP.')
+    parser.add_argument('rules', nargs='+', help='YAML or JSON rules files')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=8080, type=int)
+    parser.add_argument('--base-url', help='url of the served service')
+    parser.add_argument('--refuse-unknown', action='store_true',
+                        help='close connections of requests matching no '
+                             'rule instead of answering 404')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+
+    for path in options.rules:
+        load_rules_file(path)
+
+    serve(host=options.host, port=options.port, base_url=options.base_url,
+          refuse_unknown=options.refuse_unknown)
+
+
+if __name__ == '__main__':
+    main()
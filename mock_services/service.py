@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import json
 import logging
 import re
 try:
@@ -15,75 +14,205 @@ from .decorators import to_json
 from .decorators import trap_errors
 from .exceptions import Http400
 from .exceptions import Http404
+from .http_mock import LazyRegex
+from .http_mock import get_url_prefix
+from .json_codec import Encoded
+from .json_codec import get_codec
+from .streams import IterStream
+from .streams import iter_json
 
 
 logger = logging.getLogger(__name__)
 
 
-@attr.s
+def _update_key(ctx, attribute, value):
+    # the storage key follows its fields
+    fields = {
+        'hostname': ctx.hostname,
+        'resource': ctx.resource,
+        'action': ctx.action,
+    }
+    fields[attribute.name] = value
+    ctx.key = '{hostname}/{resource}/{action}'.format(**fields)
+    return value
+
+
+@attr.s(slots=True)
 class ResourceContext(object):
-    hostname = attr.ib()
-    resource = attr.ib()
-    action = attr.ib(default='default')
+    hostname = attr.ib(on_setattr=_update_key)
+    resource = attr.ib(on_setattr=_update_key)
+    action = attr.ib(default='default', on_setattr=_update_key)
     id = attr.ib(default=None)
 
-    @property
-    def key(self):
-        return '{hostname}/{resource}/{action}'.format(**attr.asdict(self))
+    # storage key, computed at init and when its fields change
+    key = attr.ib(init=False, repr=False)
 
+    def __attrs_post_init__(self):
+        self.key = '{0}/{1}/{2}'.format(self.hostname, self.resource,
+                                        self.action)
 
-def parse_url(request, url_pattern, id=None, require_id=False):
 
-    logger.debug('url_pattern: %s', url_pattern)
-    logger.debug('url: %s', request.url)
+@attr.s(frozen=True)
+class Route(object):
+    """Compiled url pattern of a rule."""
+    url = attr.ib()
+    regex = attr.ib()
+    groups = attr.ib()
+    hostname = attr.ib(default=None)
 
-    url_kw = re.compile(url_pattern).search(request.url).groupdict()
-    logger.debug('url_kw: %s', url_kw)
+    def __deepcopy__(self, memo):
+        # immutable, rules are deep copied on update
+        return self
 
-    if 'resource' not in url_kw:
-        raise Http404
+    def get_hostname(self, url):
+        return self.hostname or urlparse.urlparse(url).hostname
+
+
+_routes = {}
+
+
+# named groups, read without compiling the pattern
+_GROUP_NAMES = re.compile(r'\(\?P<(\w+)>')
+
+
+def compile_route(url_pattern, lazy=False):
+    """Returns the `Route` of `url_pattern`, its regex compiled on first use
+    if `lazy`, cf. `LazyRegex`.
+    """
+    if isinstance(url_pattern, Route):
+        return url_pattern
+
+    route = _routes.get(url_pattern)
+    if route is None:
+        route = _routes[url_pattern] = _compile_route(url_pattern, lazy=lazy)
+    return route
+
+
+def _compile_route(url_pattern, lazy=False):
+
+    if lazy:
+        regex = LazyRegex(url_pattern)
+        groups = _GROUP_NAMES.findall(url_pattern)
+    else:
+        regex = re.compile(url_pattern)
+        groups = regex.groupindex
 
-    if require_id and 'id' not in url_kw:
+    # hostname is known when the url prefix includes it
+    prefix = get_url_prefix(regex)
+    hostname = prefix and urlparse.urlparse(prefix).hostname
+    if lazy:
+        regex.url_prefix = prefix
+
+    return Route(
+        url=url_pattern,
+        regex=regex,
+        groups=frozenset(groups),
+        hostname=hostname or None,
+    )
+
+
+def parse_url(request, url_pattern, id=None, require_id=False):
+
+    route = compile_route(url_pattern)
+
+    if 'resource' not in route.groups:
         raise Http404
 
-    hostname = urlparse.urlparse(request.url).hostname
-    logger.debug('hostname: %s', hostname)
+    if require_id and 'id' not in route.groups:
+        raise Http404
 
-    action = url_kw.pop('action', 'default')
-    logger.debug('action: %s', action)
+    url_kw = route.regex.search(request.url).groupdict()
 
     resource_context = ResourceContext(
-        hostname=hostname,
-        resource=url_kw.pop('resource'),
-        action=action,
-        id=url_kw.pop('id', id),
+        hostname=route.get_hostname(request.url),
+        resource=url_kw['resource'],
+        action=url_kw.get('action', 'default'),
+        id=url_kw.get('id', id),
     )
-    logger.debug('resource_context: %s', attr.asdict(resource_context))
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('url_pattern: %s', route.url)
+        logger.debug('url: %s', request.url)
+        logger.debug('url_kw: %s', url_kw)
+        logger.debug('resource_context: %s', attr.asdict(resource_context))
 
     return resource_context
 
 
-def validate_data(request, attrs=None, validators=None):
+def parse_query(request, filters=None):
+    """Returns storage `to_list` arguments from the request query string.
+
+    `limit`, `offset` and `sort` are always read, other parameters only when
+    listed in `filters`.
+    """
+    if '?' not in request.url:
+        return {}
+
+    qs = urlparse.parse_qs(urlparse.urlsplit(request.url).query)
+    query = {}
+
+    for name in ['limit', 'offset']:
+        if name in qs:
+            try:
+                query[name] = int(qs[name][0])
+            except ValueError:
+                raise Http400
+            if query[name] < 0:
+                raise Http400
+
+    if 'sort' in qs:
+        query['sort'] = qs['sort'][0]
 
-    logger.debug('attrs: %s', attrs)
-    logger.debug('body: %s', request.body)
+    query_filters = {k: qs[k][0] for k in (filters or []) if k in qs}
+    if query_filters:
+        query['filters'] = query_filters
 
-    data = json.loads(request.body)
-    data_to_validate = {k: v
-                        for k, v in data.items()
-                        if k in (attrs or {}).keys()}
+    return query
+
+
+def make_validator(attrs):
+    """Returns the class validating data against the `attrs` dict."""
+    if not attrs or isinstance(attrs, type):
+        return attrs or None
+    return attr.make_class('Validator', attrs)
+
+
+def validate_attrs(data, attrs=None):
+
+    validator = make_validator(attrs)
+    if validator is None:
+        return data
+
+    fields = attr.fields(validator)
+    data_to_validate = {a.name: data[a.name] for a in fields if a.name in data}
     logger.debug('data_to_validate: %s', data_to_validate)
 
     # missing field
-    if attrs and not data_to_validate:
+    if not data_to_validate:
         raise Http400
 
     # invalid field
-    if data_to_validate:
-        try:
-            attr.make_class("C", attrs)(**data_to_validate)
-        except (TypeError, ValueError):
-            raise Http400
+    try:
+        validator(**data_to_validate)
+    except (TypeError, ValueError):
+        raise Http400
+
+    return data
+
+
+def validate_all(items, attrs=None):
+    """Validates a list of dicts against the same `attrs`."""
+    validator = make_validator(attrs)
+    return [validate_attrs(data, validator) for data in items]
+
+
+def validate_data(request, attrs=None, validators=None, codec=None):
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('attrs: %s', attrs)
+        logger.debug('body: %s', request.body)
+
+    data = validate_attrs(get_codec(codec).loads(request.body), attrs)
 
     # custom validation
     for validate_func in (validators or []):
@@ -94,18 +223,53 @@ def validate_data(request, attrs=None, validators=None):
 
 @to_json
 @trap_errors
-def list_cb(request, context, url=None, **kwargs):
+def list_cb(request, context, url=None, filters=None, indexes=None,
+            codec=None, **kwargs):
     resource_context = parse_url(request, url)
+    if indexes:
+        storage.ensure_indexes(resource_context, indexes)
+    # indexed fields are filters too
+    query = parse_query(request,
+                        filters=list(filters or []) + list(indexes or []))
     context.status_code = 200
-    return storage.to_list(resource_context)
+    return Encoded(storage.to_list_json(resource_context, get_codec(codec),
+                                        **query))
+
+
+@trap_errors
+def _iter_list(request, context, url=None, filters=None, indexes=None,
+               **kwargs):
+    resource_context = parse_url(request, url)
+    if indexes:
+        storage.ensure_indexes(resource_context, indexes)
+    query = parse_query(request,
+                        filters=list(filters or []) + list(indexes or []))
+    context.status_code = 200
+    return storage.iter_list(resource_context, **query)
+
+
+def list_stream_cb(request, context, stream='json', codec=None, **kwargs):
+    """LIST callback streaming the resources as a JSON array, or one by line
+    with the "ndjson" `stream` format.
+    """
+    codec = get_codec(codec)
+    items = _iter_list(request, context, **kwargs)
+
+    # traped error
+    if context.status_code >= 400:
+        return IterStream([codec.dumps({'error': items})])
+
+    if stream == 'ndjson':
+        context.headers['Content-Type'] = 'application/x-ndjson'
+    return IterStream(iter_json(items, codec, format=stream))
 
 
 @to_json
 @trap_errors
-def get_cb(request, context, url=None, **kwargs):
+def get_cb(request, context, url=None, codec=None, **kwargs):
     resource_context = parse_url(request, url, require_id=True)
     context.status_code = 200
-    return storage.get(resource_context)
+    return Encoded(storage.get_json(resource_context, get_codec(codec)))
 
 
 @trap_errors
@@ -120,19 +284,27 @@ def head_cb(request, context, url=None, id_name='id', **kwargs):
 @to_json
 @trap_errors
 def post_cb(request, context, url=None, id_name='id', id_factory=int,
-            attrs=None, validators=None, **kwargs):
+            attrs=None, validators=None, indexes=None, codec=None,
+            **kwargs):
 
-    data = validate_data(request, attrs=attrs, validators=validators)
+    data = validate_data(request, attrs=attrs, validators=validators,
+                         codec=codec)
 
-    id = storage.next_id(id_factory)
+    resource_context = parse_url(request, url)
+    if indexes:
+        storage.ensure_indexes(resource_context, indexes)
+
+    id = storage.next_id(id_factory, ctx=resource_context)
     logger.debug('id: %s', id)
 
+    if resource_context.id is None:
+        resource_context.id = id
+
     data.update({
         id_name: id
     })
     logger.debug('data: %s', data)
 
-    resource_context = parse_url(request, url, id=id)
     context.status_code = 201
 
     return storage.add(resource_context, data)
@@ -141,9 +313,10 @@ def post_cb(request, context, url=None, id_name='id', id_factory=int,
 @to_json
 @trap_errors
 def patch_cb(request, context, url=None, attrs=None, validators=None,
-             **kwargs):
+             codec=None, **kwargs):
 
-    data = validate_data(request, attrs=attrs, validators=validators)
+    data = validate_data(request, attrs=attrs, validators=validators,
+                         codec=codec)
     logger.debug('data: %s', data)
 
     resource_context = parse_url(request, url, require_id=True)
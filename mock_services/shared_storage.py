@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Storage shared by the processes of one machine, ie. pytest-xdist workers.
+
+Resources are kept by a server process, workers connect to it through a
+local socket and each storage operation is atomic.
+"""
+from __future__ import absolute_import
+
+import itertools
+
+from itertools import islice
+from multiprocessing.managers import BaseManager
+
+import attr
+
+from .json_codec import get_codec
+from .storage import BaseStorage
+from .storage import Storage
+from .storage import seed_id
+
+
+class StorageServer(Storage):
+    """Storage kept by the server process.
+
+    Codecs are given by name and snapshots kept server side, so that only
+    resources are sent to workers.
+    """
+
+    def __init__(self, **kwargs):
+        self._snapshots = {}
+        self._snapshot_ids = itertools.count(1)
+        super(StorageServer, self).__init__(concurrent=True, **kwargs)
+
+    def get_json(self, ctx, codec):
+        return super(StorageServer, self).get_json(ctx, get_codec(codec))
+
+    def next_sequence(self, ctx, size):
+        return list(self._next_sequence(ctx, size))
+
+    def restore(self, snapshot):
+        super(StorageServer, self).restore(self._snapshots[snapshot])
+
+    def snapshot(self):
+        snapshot = next(self._snapshot_ids)
+        self._snapshots[snapshot] = super(StorageServer, self).snapshot()
+        return snapshot
+
+    def to_list_json(self, ctx, codec, **query):
+        return super(StorageServer, self).to_list_json(
+            ctx, get_codec(codec), **query)
+
+
+_server_storage = None
+
+
+def _get_server_storage():
+    global _server_storage
+    if _server_storage is None:
+        _server_storage = StorageServer()
+    return _server_storage
+
+
+class StorageManager(BaseManager):
+    pass
+
+
+StorageManager.register('get_storage', callable=_get_server_storage)
+
+
+def start_storage_server(address=None, authkey=None):
+    """Starts the storage server process and returns its manager.
+
+    `manager.address` and `authkey` are then given to workers to connect a
+    `SharedStorage`. The server stops with `manager.shutdown()`.
+    """
+    manager = StorageManager(address=address, authkey=authkey)
+    manager.start()
+    return manager
+
+
+class SharedStorage(BaseStorage):
+    """Storage client of a storage server.
+
+    >>> from mock_services import storage
+    >>> storage.set_backend(SharedStorage(address, authkey))
+    """
+
+    def __init__(self, address, authkey=None, **kwargs):
+        manager = StorageManager(address=address, authkey=authkey)
+        manager.connect()
+        self._server = manager.get_storage()
+        super(SharedStorage, self).__init__(**kwargs)
+
+    def _next_sequence(self, ctx, size):
+        return self._server.next_sequence(ctx, size)
+
+    def set_cache_bodies(self, cache):
+        """Set flag to keep encoded resources and lists until they change.
+
+        Bodies are cached by the server, for all workers.
+        """
+        self._server.set_cache_bodies(cache)
+
+    def set_concurrent(self, concurrent):
+        """Operations are always atomic on the server."""
+
+    def add(self, ctx, data):
+        return self._server.add(ctx, data)
+
+    def ensure_indexes(self, ctx, fields):
+        self._server.ensure_indexes(ctx, list(fields))
+
+    def get(self, ctx):
+        return self._server.get(ctx)
+
+    def get_json(self, ctx, codec):
+        return self._server.get_json(ctx, codec.name)
+
+    def to_list(self, ctx, filters=None, sort=None, offset=0, limit=None):
+        return self._server.to_list(ctx, filters=filters, sort=sort,
+                                    offset=offset, limit=limit)
+
+    def to_list_json(self, ctx, codec, **query):
+        return self._server.to_list_json(ctx, codec.name, **query)
+
+    def remove(self, ctx):
+        self._server.remove(ctx)
+
+    def seed(self, ctx, items, id_name='id', id_factory=None):
+        # sent by batches, id factories are local
+        items = iter(items)
+        count = 0
+        seeded = []
+
+        try:
+            while True:
+                batch = list(islice(items, 1024))
+                if not batch:
+                    break
+
+                if id_factory is not None:
+                    ids = self.reserve_ids(id_factory, len(batch), ctx=ctx)
+                    for data, id in zip(batch, ids):
+                        data[id_name] = id
+
+                ids = [seed_id(data, id_name, count + i)
+                       for i, data in enumerate(batch)]
+                # seeded ids also move the server sequence forward
+                count += self._server.seed(ctx, batch, id_name=id_name)
+                seeded.extend(ids)
+        except Exception:
+            # the failed batch is not seeded, remove the previous ones
+            for id in seeded:
+                self._server.remove(attr.evolve(ctx, id=id))
+            raise
+
+        return count
+
+    def reset(self):
+        self._server.reset()
+
+    def restore(self, snapshot):
+        self._server.restore(snapshot)
+
+    def snapshot(self):
+        return self._server.snapshot()
+
+    def update(self, ctx, data):
+        return self._server.update(ctx, data)
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import json
+import os
+import sqlite3
+import tempfile
+import weakref
+
+from itertools import islice
+
+from .exceptions import Http404
+from .exceptions import Http409
+from .storage import BaseStorage
+from .storage import filter_items
+from .storage import max_sequence
+from .storage import query_value
+from .storage import seed_id
+from .storage import slice_items
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS resources (
+    rowid INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (key, id)
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS indexes (
+    key TEXT NOT NULL,
+    field TEXT NOT NULL,
+    PRIMARY KEY (key, field)
+);
+CREATE TABLE IF NOT EXISTS fields (
+    key TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fields_value ON fields (key, field, value);
+CREATE INDEX IF NOT EXISTS fields_id ON fields (key, id);
+'''
+
+
+def _remove_snapshot(connection, path):
+    connection.close()
+    os.remove(path)
+
+
+class SqliteSnapshot(object):
+    """Copy of the database in a temporary file, removed once the snapshot is
+    collected or closed.
+    """
+
+    def __init__(self, connection, dir=None):
+        fd, self.path = tempfile.mkstemp(suffix='.db', dir=dir)
+        os.close(fd)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.backup(self.connection)
+        self._finalizer = weakref.finalize(self, _remove_snapshot,
+                                           self.connection, self.path)
+
+    def close(self):
+        self._finalizer()
+
+
+class SqliteStorage(BaseStorage):
+    """Storage kept in a SQLite database file.
+
+    Resources are read from disk on demand, so the memory used does not grow
+    with the number of stored resources. Resources returned by `get` and
+    `to_list` are copies: they must be changed through `update`.
+
+    >>> from mock_services import storage
+    >>> storage.set_backend(SqliteStorage('/tmp/fixtures.db'))
+    """
+
+    # one connection, one lock
+    _stripes = 1
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self._connection = sqlite3.connect(path, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        self._indexed = {}
+        super(SqliteStorage, self).__init__(**kwargs)
+
+    def _execute(self, sql, *args):
+        return self._connection.execute(sql, args)
+
+    def _get_indexed(self, key):
+        if key not in self._indexed:
+            self._indexed[key] = set(field for field, in self._execute(
+                'SELECT field FROM indexes WHERE key = ?', key))
+        return self._indexed[key]
+
+    def _index(self, key, id, data):
+        self._connection.executemany(
+            'INSERT INTO fields (key, field, value, id) VALUES (?, ?, ?, ?)',
+            [(key, field, query_value(data.get(field)), id)
+             for field in self._get_indexed(key)])
+
+    def _unindex(self, key, id):
+        self._execute('DELETE FROM fields WHERE key = ? AND id = ?', key, id)
+
+    def _next_sequence(self, ctx, size):
+        key = ctx.key if ctx is not None else ''
+        with self._get_lock(key):
+            row = self._execute('SELECT value FROM sequences WHERE key = ?',
+                                key).fetchone()
+            start = row[0] if row else 0
+            self._execute('INSERT OR REPLACE INTO sequences (key, value) '
+                          'VALUES (?, ?)', key, start + size)
+        return range(start + 1, start + size + 1)
+
+    def add(self, ctx, data):
+        ctx.id = str(ctx.id)
+        with self._get_lock(ctx.key):
+            try:
+                self._execute('INSERT INTO resources (key, id, data) '
+                              'VALUES (?, ?, ?)',
+                              ctx.key, ctx.id, json.dumps(data))
+            except sqlite3.IntegrityError:
+                raise Http409
+            self._index(ctx.key, ctx.id, data)
+        return data
+
+    def ensure_indexes(self, ctx, fields):
+        indexed = self._get_indexed(ctx.key)
+        if all(field in indexed for field in fields):
+            return
+
+        with self._get_lock(ctx.key):
+            for field in fields:
+                if field in indexed:
+                    continue
+                self._execute('INSERT INTO indexes (key, field) '
+                              'VALUES (?, ?)', ctx.key, field)
+                self._connection.executemany(
+                    'INSERT INTO fields (key, field, value, id) '
+                    'VALUES (?, ?, ?, ?)',
+                    ((ctx.key, field, query_value(json.loads(data).get(field)),
+                      id) for id, data in self._execute(
+                          'SELECT id, data FROM resources WHERE key = ?',
+                          ctx.key).fetchall()))
+                indexed.add(field)
+
+    def _get_data(self, ctx):
+        ctx.id = str(ctx.id)
+        row = self._execute('SELECT data FROM resources '
+                            'WHERE key = ? AND id = ?',
+                            ctx.key, ctx.id).fetchone()
+        if row is None:
+            raise Http404
+        return row[0]
+
+    def get(self, ctx):
+        with self._get_lock(ctx.key):
+            return json.loads(self._get_data(ctx))
+
+    def get_json(self, ctx, codec):
+        # already encoded
+        with self._get_lock(ctx.key):
+            return self._get_data(ctx).encode('utf-8')
+
+    def _select(self, ctx, filters, sort, offset, limit):
+        # returns the rows cursor and the offset left to skip
+        indexed = [k for k in (filters or {})
+                   if k in self._get_indexed(ctx.key)]
+
+        if indexed:
+            return self._execute(
+                'SELECT r.data FROM resources r JOIN fields f '
+                'ON f.key = r.key AND f.id = r.id '
+                'WHERE f.key = ? AND f.field = ? AND f.value = ? '
+                'ORDER BY r.rowid',
+                ctx.key, indexed[0], query_value(filters[indexed[0]])), offset
+
+        if not filters and not sort:
+            # let the database slice
+            return self._execute(
+                'SELECT data FROM resources WHERE key = ? '
+                'ORDER BY rowid LIMIT ? OFFSET ?',
+                ctx.key, -1 if limit is None else limit, offset), 0
+
+        return self._execute(
+            'SELECT data FROM resources WHERE key = ? ORDER BY rowid',
+            ctx.key), offset
+
+    def iter_list(self, ctx, filters=None, sort=None, offset=0, limit=None):
+        """Streams resources from the database, unless sorted."""
+        if sort:
+            return iter(self.to_list(ctx, filters=filters, sort=sort,
+                                     offset=offset, limit=limit))
+
+        with self._get_lock(ctx.key):
+            rows, offset = self._select(ctx, filters, sort, offset, limit)
+
+        items = filter_items((json.loads(data) for data in
+                              self._fetch(ctx, rows)), filters)
+        return islice(items, offset, None if limit is None
+                      else offset + limit)
+
+    def _fetch(self, ctx, rows):
+        # rows are fetched by batches while iterating, the connection is
+        # shared by all the threads
+        while True:
+            with self._get_lock(ctx.key):
+                batch = rows.fetchmany(1024)
+            if not batch:
+                break
+            for data, in batch:
+                yield data
+
+    def to_list(self, ctx, filters=None, sort=None, offset=0, limit=None):
+        with self._get_lock(ctx.key):
+            rows, offset = self._select(ctx, filters, sort, offset, limit)
+            items = (json.loads(data) for data, in rows)
+            return slice_items(filter_items(items, filters),
+                               sort=sort, offset=offset, limit=limit)
+
+    def remove(self, ctx):
+        ctx.id = str(ctx.id)
+        with self._get_lock(ctx.key):
+            cursor = self._execute('DELETE FROM resources '
+                                   'WHERE key = ? AND id = ?',
+                                   ctx.key, ctx.id)
+            if not cursor.rowcount:
+                raise Http404
+            self._unindex(ctx.key, ctx.id)
+
+    def seed(self, ctx, items, id_name='id', id_factory=None):
+        items = iter(items)
+        count = 0
+        last = 0
+
+        with self._get_lock(ctx.key):
+            self._execute('BEGIN')
+            try:
+                while True:
+                    batch = list(islice(items, 1024))
+                    if not batch:
+                        break
+
+                    if id_factory is not None:
+                        ids = self.reserve_ids(id_factory, len(batch),
+                                               ctx=ctx)
+                        for data, id in zip(batch, ids):
+                            data[id_name] = id
+
+                    rows = [(ctx.key, seed_id(data, id_name, count + i),
+                             json.dumps(data))
+                            for i, data in enumerate(batch)]
+                    self._connection.executemany(
+                        'INSERT INTO resources (key, id, data) '
+                        'VALUES (?, ?, ?)', rows)
+                    for data, (_, id, _) in zip(batch, rows):
+                        self._index(ctx.key, id, data)
+
+                    count += len(batch)
+                    last = max_sequence((id for _, id, _ in rows), last)
+
+                if id_factory is None:
+                    self._execute(
+                        'INSERT OR REPLACE INTO sequences (key, value) '
+                        'SELECT ?, MAX(?, COALESCE(MAX(value), 0)) '
+                        'FROM sequences WHERE key = ?', ctx.key, last, ctx.key)
+            except sqlite3.IntegrityError:
+                self._execute('ROLLBACK')
+                raise Http409
+            except Exception:
+                self._execute('ROLLBACK')
+                raise
+            self._execute('COMMIT')
+
+        return count
+
+    def reset(self):
+        for table in ['resources', 'sequences', 'indexes', 'fields']:
+            self._execute('DELETE FROM {0}'.format(table))
+        self._indexed = {}
+
+    def restore(self, snapshot):
+        with self._get_lock(''):
+            snapshot.connection.backup(self._connection)
+        self._indexed = {}
+
+    def snapshot(self):
+        """Returns a copy of the database in a temporary file, next to the
+        database one.
+        """
+        dir = None
+        if self.path != ':memory:':
+            dir = os.path.dirname(os.path.abspath(self.path))
+        with self._get_lock(''):
+            return SqliteSnapshot(self._connection, dir=dir)
+
+    def update(self, ctx, data):
+        with self._get_lock(ctx.key):
+            item = json.loads(self._get_data(ctx))
+            item.update(data)
+            self._execute('UPDATE resources SET data = ? '
+                          'WHERE key = ? AND id = ?',
+                          json.dumps(item), ctx.key, ctx.id)
+            if self._get_indexed(ctx.key):
+                self._unindex(ctx.key, ctx.id)
+                self._index(ctx.key, ctx.id, item)
+        return item
@@ -1,28 +1,114 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import heapq
+import itertools
+import json
 import logging
 import uuid
 
+from collections import OrderedDict
 from collections import defaultdict
 from functools import wraps
-from itertools import count
+from itertools import islice
+from threading import RLock
 
+import attr
+
+from . import metrics
+from .exceptions import Http400
 from .exceptions import Http404
 from .exceptions import Http409
 from .exceptions import Http500
+from .json_codec import get_codec
 
 
 logger = logging.getLogger(__name__)
 
 
+def query_value(value):
+    """Returns `value` as it would be written in a query string."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def seed_id(data, id_name, position):
+    """Returns the id of the `position`th seeded item, as stored."""
+    try:
+        return str(data[id_name])
+    except (KeyError, TypeError):
+        raise Http400('seeded item {0} has no "{1}" field'.format(
+            position, id_name))
+
+
+def max_sequence(ids, start=0):
+    """Returns the largest of `start` and the numeric `ids`, ie. seeded ones,
+    so that the resource sequence does not give them again.
+    """
+    return max([start] + [int(id) for id in ids if id.isdigit()])
+
+
+def filter_items(items, filters=None):
+    """Yields `items` matching all `filters` fields values."""
+    if not filters:
+        return items
+    filters = [(k, query_value(v)) for k, v in filters.items()]
+    return (item for item in items
+            if all(query_value(item.get(k)) == v for k, v in filters))
+
+
+def slice_items(items, sort=None, offset=0, limit=None):
+    """Returns `items` sorted by the `sort` field ("-field" for descending
+    order) and sliced by `offset` and `limit`.
+
+    Only the returned items are copied, a sorted page is picked with a heap of
+    `offset + limit` items.
+    """
+    stop = None if limit is None else offset + limit
+
+    if sort:
+        reverse = sort.startswith('-')
+        field = sort.lstrip('-')
+
+        # missing fields last
+        def sort_key(item):
+            return ((field not in item) != reverse, item.get(field))
+
+        try:
+            if stop is None:
+                items = sorted(items, key=sort_key, reverse=reverse)
+            elif reverse:
+                items = heapq.nlargest(stop, items, key=sort_key)
+            else:
+                items = heapq.nsmallest(stop, items, key=sort_key)
+        except TypeError:
+            # not comparable values
+            raise Http400
+
+    return list(islice(items, offset, stop))
+
+
+class _NoLock(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_no_lock = _NoLock()
+
+
 def check_conflict(f):
     @wraps(f)
     def wrapped(self, ctx, *args, **kwargs):
         ctx.id = str(ctx.id)
-        if ctx.id in self._registry[ctx.key]:
-            raise Http409
-        return f(self, ctx, *args, **kwargs)
+        with self._get_lock(ctx.key):
+            if ctx.id in self._registry[ctx.key]:
+                raise Http409
+            return f(self, ctx, *args, **kwargs)
     return wrapped
 
 
@@ -30,59 +116,441 @@ def check_exist(f):
     @wraps(f)
     def wrapped(self, ctx, *args, **kwargs):
         ctx.id = str(ctx.id)
-        if ctx.id not in self._registry[ctx.key]:
-            raise Http404
-        return f(self, ctx, *args, **kwargs)
+        with self._get_lock(ctx.key):
+            if ctx.id not in self._registry[ctx.key]:
+                raise Http404
+            return f(self, ctx, *args, **kwargs)
     return wrapped
 
 
-class Storage(object):
+@attr.s(frozen=True)
+class StorageSnapshot(object):
+    registry = attr.ib()
+    indexes = attr.ib()
+    sequences = attr.ib()
+
+
+class BaseStorage(object):
+    """Storage backends interface.
+
+    Resources are dicts stored by `ResourceContext.key` and id. Missing
+    resources raise `Http404`, already existing ones `Http409`.
+    """
+
+    _id_factories = None
+    _locks = None
+    _stripes = 64
+
+    def __init__(self, concurrent=False, stripes=None):
+        self._id_factories = {
+            int: int,
+            uuid.UUID: lambda seq: str(uuid.uuid4()),
+        }
+        self._stripes = stripes or self._stripes
+        self.set_concurrent(concurrent)
+
+    def _get_lock(self, key):
+        if self._locks is None:
+            return _no_lock
+        return self._locks[hash(key) % self._stripes]
+
+    def _next_sequence(self, ctx, size):
+        """Returns the next `size` numbers of the `ctx` resource sequence."""
+        raise NotImplementedError
+
+    def set_concurrent(self, concurrent):
+        """Set flag to make operations atomic when storage is shared between
+        threads.
+
+        Resources keys are spread over a fixed set of locks so unrelated
+        resources rarely contend.
+        """
+        if concurrent:
+            self._locks = [RLock() for _ in range(self._stripes)]
+        else:
+            self._locks = None
+
+    def set_cache_bodies(self, cache):
+        """Set flag to keep encoded resources and lists until they change."""
+
+    def add(self, ctx, data):
+        raise NotImplementedError
+
+    def ensure_indexes(self, ctx, fields):
+        """Maintain indexes of the `ctx` resources `fields` values to answer
+        `to_list` filters.
+        """
+
+    def get(self, ctx):
+        raise NotImplementedError
+
+    def get_json(self, ctx, codec):
+        """Returns the `ctx` resource encoded by `codec`, as bytes."""
+        return codec.encode(self.get(ctx))
+
+    def to_list_json(self, ctx, codec, **query):
+        """Returns `to_list` result encoded by `codec`, as bytes."""
+        return codec.encode(self.to_list(ctx, **query))
+
+    def to_list(self, ctx, filters=None, sort=None, offset=0, limit=None):
+        """Returns the `ctx` resources matching `filters` fields values,
+        sorted and sliced, cf. `slice_items`.
+        """
+        raise NotImplementedError
+
+    def iter_list(self, ctx, **query):
+        """Returns an iterator of `to_list` result, backends reading resources
+        from disk stream them.
+        """
+        return iter(self.to_list(ctx, **query))
+
+    def next_id(self, id_factory, ctx=None):
+        return self.reserve_ids(id_factory, 1, ctx=ctx)[0]
+
+    def register_id_factory(self, id_factory, func):
+        """Register `func` to build ids of rules with `id_factory`.
+
+        `func` gets the next number of the resource sequence, ie.:
+
+        >>> storage.register_id_factory('user', 'user_{0}'.format)
+        """
+        self._id_factories[id_factory] = func
+
+    def reserve_ids(self, id_factory, size, ctx=None):
+        """Returns a block of `size` ids for the `ctx` resource.
+
+        Sequences are kept by resource, so ids only depend on the resources
+        previously added.
+        """
+        try:
+            func = self._id_factories[id_factory]
+        except (KeyError, TypeError):
+            logger.error('invalid id factory: %s', id_factory)
+            raise Http500
+        return [func(seq) for seq in self._next_sequence(ctx, size)]
+
+    def remove(self, ctx):
+        raise NotImplementedError
+
+    def seed(self, ctx, items, id_name='id', id_factory=None):
+        """Adds the `items` dicts to the `ctx` resources in bulk.
+
+        Items ids are read from their `id_name` field, or set to new ids when
+        an `id_factory` is given. `items` is consumed as a stream, ie. from a
+        generator.
+
+        Raises Http400 for items without id, or Http409 for existing ids, in
+        which case none of the `items` is added.
+
+        Returns the number of items added.
+        """
+        raise NotImplementedError
+
+    def seed_file(self, ctx, path, codec=None, **kwargs):
+        """Adds the resources of a JSON Lines file, cf. `seed`."""
+        loads = get_codec(codec).loads
+        with open(path) as f:
+            return self.seed(ctx, (loads(line) for line in f if line.strip()),
+                             **kwargs)
+
+    def reset(self):
+        raise NotImplementedError
+
+    def restore(self, snapshot):
+        raise NotImplementedError
 
-    _counter = None
+    def snapshot(self):
+        raise NotImplementedError
+
+    def update(self, ctx, data):
+        raise NotImplementedError
+
+
+class Storage(BaseStorage):
+    """In memory storage."""
+
+    _bodies = None
+    _cache_bodies = False
+    _indexes = None
     _registry = None
+    _sequences = None
+    _shared = None
 
-    def __init__(self):
+    def __init__(self, **kwargs):
+        # indexes map values to ids and their insertion position, never
+        # restarted so that positions of restored snapshots stay in order
+        self._positions = itertools.count(1)
         self.reset()
+        super(Storage, self).__init__(**kwargs)
+
+    def _index(self, ctx, data):
+        position = next(self._positions)
+        for field, index in self._indexes.get(ctx.key, {}).items():
+            index[query_value(data.get(field))][ctx.id] = position
+
+    def _reindex(self, ctx, previous, data):
+        # changed values only, at the same position
+        for field, index in self._indexes.get(ctx.key, {}).items():
+            value = query_value(data.get(field))
+            previous_value = query_value(previous.get(field))
+            if value == previous_value:
+                continue
+            position = index[previous_value].pop(ctx.id)
+            if not index[previous_value]:
+                del index[previous_value]
+            index[value][ctx.id] = position
+
+    def _unindex(self, ctx, data):
+        for field, index in self._indexes.get(ctx.key, {}).items():
+            value = query_value(data.get(field))
+            del index[value][ctx.id]
+            if not index[value]:
+                del index[value]
+
+    def _own(self, ctx):
+        # copy resources shared with a snapshot before changing them
+        if ctx.key in self._shared:
+            self._shared.discard(ctx.key)
+            self._registry[ctx.key] = dict(self._registry[ctx.key])
+            if ctx.key in self._indexes:
+                self._indexes[ctx.key] = dict(
+                    (field, defaultdict(OrderedDict, (
+                        (value, OrderedDict(ids))
+                        for value, ids in index.items()
+                    )))
+                    for field, index in self._indexes[ctx.key].items()
+                )
+
+    def _invalidate(self, ctx):
+        # resource and resources lists bodies
+        if self._cache_bodies:
+            self._bodies.pop((ctx.key, ctx.id), None)
+            self._bodies.pop(ctx.key, None)
+
+    def _next_sequence(self, ctx, size):
+        key = ctx.key if ctx is not None else None
+        with self._get_lock(key):
+            start = self._sequences.get(key, 0)
+            self._sequences[key] = start + size
+        return range(start + 1, start + size + 1)
+
+    def set_cache_bodies(self, cache):
+        """Set flag to keep encoded resources and lists until they change.
+
+        Stored resources must then only be changed through `update`.
+        """
+        self._cache_bodies = cache
+        self._bodies = {}
 
     @check_conflict
     def add(self, ctx, data):
+        self._own(ctx)
+        self._invalidate(ctx)
         self._registry[ctx.key][ctx.id] = data
+        self._index(ctx, data)
         return data
 
+    def ensure_indexes(self, ctx, fields):
+        """Maintain hash indexes of the `ctx` resources `fields` values.
+
+        Missing indexes are built from the stored resources, then kept up to
+        date by `add`, `update` and `remove` to answer `to_list` filters.
+        """
+        indexes = self._indexes.get(ctx.key, {})
+        if all(field in indexes for field in fields):
+            return
+
+        with self._get_lock(ctx.key):
+            self._own(ctx)
+            indexes = self._indexes.setdefault(ctx.key, {})
+            for field in fields:
+                if field in indexes:
+                    continue
+                index = defaultdict(OrderedDict)
+                for id, data in self._registry[ctx.key].items():
+                    index[query_value(data.get(field))][id] = \
+                        next(self._positions)
+                indexes[field] = index
+
     @check_exist
     def get(self, ctx):
         return self._registry[ctx.key][ctx.id]
 
-    def to_list(self, ctx):
-        return list(self._registry[ctx.key].values())
+    @check_exist
+    def get_json(self, ctx, codec):
+        """Returns the `ctx` resource encoded by `codec`, as bytes."""
+        if not self._cache_bodies:
+            return codec.encode(self._registry[ctx.key][ctx.id])
+
+        cached = self._bodies.get((ctx.key, ctx.id))
+        if cached is None or cached[0] != codec.name:
+            cached = self._bodies[(ctx.key, ctx.id)] = (
+                codec.name,
+                codec.encode(self._registry[ctx.key][ctx.id]),
+            )
+        return cached[1]
 
-    def next_id(self, id_factory):
-        if id_factory == int:
-            return next(self._counter)
-        if id_factory == uuid.UUID:
-            return str(uuid.uuid4())
-        logger.error('invalid id factory: %s', id_factory)
-        raise Http500
+    def to_list_json(self, ctx, codec, **query):
+        """Returns `to_list` result encoded by `codec`, as bytes."""
+        if not self._cache_bodies:
+            return codec.encode(self.to_list(ctx, **query))
+
+        query_key = (codec.name, tuple(sorted(
+            (k, tuple(sorted(v.items())) if k == 'filters' else v)
+            for k, v in query.items()
+        )))
+
+        with self._get_lock(ctx.key):
+            bodies = self._bodies.setdefault(ctx.key, {})
+            if query_key not in bodies:
+                bodies[query_key] = codec.encode(self.to_list(ctx, **query))
+            return bodies[query_key]
+
+    def to_list(self, ctx, filters=None, sort=None, offset=0, limit=None):
+        with self._get_lock(ctx.key):
+            registry = self._registry[ctx.key]
+            items = registry.values()
+
+            indexes = self._indexes.get(ctx.key, {})
+            indexed = [k for k in (filters or {}) if k in indexes]
+            if indexed:
+                # start from the smallest matching index entry, in the
+                # resources order
+                ids = min((indexes[k].get(query_value(filters[k]), {})
+                           for k in indexed), key=len)
+                items = [registry[id] for id in sorted(ids, key=ids.get)]
+
+            return slice_items(filter_items(items, filters),
+                               sort=sort, offset=offset, limit=limit)
 
     @check_exist
     def remove(self, ctx):
+        self._own(ctx)
+        self._invalidate(ctx)
+        self._unindex(ctx, self._registry[ctx.key][ctx.id])
         del self._registry[ctx.key][ctx.id]
 
+    def seed(self, ctx, items, id_name='id', id_factory=None):
+        items = iter(items)
+        count = 0
+
+        with self._get_lock(ctx.key):
+            self._own(ctx)
+            if self._cache_bodies:
+                self._bodies.pop(ctx.key, None)
+
+            registry = self._registry[ctx.key]
+            indexes = self._indexes.get(ctx.key, {}).items()
+            seeded = []
+
+            try:
+                while True:
+                    batch = list(islice(items, 1024))
+                    if not batch:
+                        break
+
+                    if id_factory is not None:
+                        ids = self.reserve_ids(id_factory, len(batch),
+                                               ctx=ctx)
+                        for data, id in zip(batch, ids):
+                            data[id_name] = id
+
+                    for data in batch:
+                        id = seed_id(data, id_name, count)
+                        if id in registry:
+                            raise Http409
+                        registry[id] = data
+                        seeded.append(id)
+                        position = next(self._positions)
+                        for field, index in indexes:
+                            index[query_value(data.get(field))][id] = \
+                                position
+                        count += 1
+            except Exception:
+                # nothing seeded on failure
+                for id in seeded:
+                    self._unindex(attr.evolve(ctx, id=id), registry.pop(id))
+                raise
+
+            if id_factory is None:
+                self._sequences[ctx.key] = max_sequence(
+                    seeded, self._sequences.get(ctx.key, 0))
+
+        return count
+
     def reset(self):
-        self._counter = count(start=1)
+        self._bodies = {}
+        self._indexes = {}
         self._registry = defaultdict(dict)
+        self._sequences = {}
+        self._shared = set()
+
+    def restore(self, snapshot):
+        """Restore the state of a `snapshot`.
+
+        Resources are shared with the snapshot until they are changed, so
+        restoring does not depend on the number of stored resources.
+        """
+        self._bodies = {}
+        self._indexes = dict(snapshot.indexes)
+        self._registry = defaultdict(dict, snapshot.registry)
+        self._sequences = dict(snapshot.sequences)
+        self._shared = set(snapshot.registry)
+
+    def snapshot(self):
+        """Returns the current state, to be restored with `restore`.
+
+        Resources are then copied on write, `update` replaces them instead
+        of changing them in place.
+        """
+        snapshot = StorageSnapshot(
+            registry=dict(self._registry),
+            indexes=dict(self._indexes),
+            sequences=dict(self._sequences),
+        )
+        self._shared = set(snapshot.registry)
+        return snapshot
 
     @check_exist
     def update(self, ctx, data):
-        self._registry[ctx.key][ctx.id].update(data)
-        return self._registry[ctx.key][ctx.id]
+        self._own(ctx)
+        self._invalidate(ctx)
+        previous = self._registry[ctx.key][ctx.id]
+        item = dict(previous)
+        item.update(data)
+        self._registry[ctx.key][ctx.id] = item
+        self._reindex(ctx, previous, item)
+        return item
 
 
 _storage = Storage()
 
-__all__ = []
 
-# expose storage instance public methods
-for __attr in (a for a in dir(_storage) if not a.startswith('_')):
+def get_backend():
+    return _storage
+
+
+def set_backend(backend):
+    """Set the storage used by REST rules, ie. a `SqliteStorage`."""
+    global _storage
+    _storage = backend
+
+
+def _dispatch(name):
+    def method(*args, **kwargs):
+        if metrics._metrics.enabled:
+            metrics.count_storage(name)
+        return getattr(_storage, name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+__all__ = [
+    'get_backend',
+    'set_backend',
+]
+
+# expose storage backend public methods
+for __attr in (a for a in dir(BaseStorage) if not a.startswith('_')):
     __all__.append(__attr)
-    globals()[__attr] = getattr(_storage, __attr)
+    globals()[__attr] = _dispatch(__attr)
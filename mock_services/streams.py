@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Streamed responses bodies, read chunk by chunk by the clients."""
+import io
+
+# encoded items are sent by chunks of about this size
+CHUNK_SIZE = 65536
+
+
+class IterStream(io.RawIOBase):
+    """Readable stream of the `iterable` chunks, closed once consumed.
+
+    Chunks are bytes or text encoded in UTF-8.
+    """
+
+    def __init__(self, iterable):
+        self._iterator = iter(iterable)
+        self._buffer = b''
+
+    def close(self):
+        # ie. closes the file read by a generator
+        close = getattr(self._iterator, 'close', None)
+        if close is not None:
+            close()
+        super(IterStream, self).close()
+
+    def read(self, size=-1):
+        # as a closed HTTPResponse
+        if self.closed:
+            return b''
+        return super(IterStream, self).read(size)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                chunk = next(self._iterator)
+            except StopIteration:
+                self.close()
+                return 0
+            if not isinstance(chunk, bytes):
+                chunk = chunk.encode('utf-8')
+            self._buffer = chunk
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def as_body(text, body='text'):
+    """Returns `text`, or bytes, as the value of the `body` rule argument:
+    "text", "content" or "body".
+    """
+    if body == 'body':
+        return IterStream([text])
+    if body == 'content' and not isinstance(text, bytes):
+        return text.encode('utf-8')
+    if body == 'text' and isinstance(text, bytes):
+        return text.decode('utf-8')
+    return text
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_json(items, codec, format='json'):
+    """Yields the `items` encoded by `codec` as a JSON array, or one by line
+    with the "ndjson" format.
+    """
+    if format == 'ndjson':
+        start, separator, end = '', '\n', '\n'
+    else:
+        start, separator, end = '[', ', ', ']'
+
+    chunk = [start]
+    size = 0
+    first = True
+
+    for item in items:
+        if not first:
+            chunk.append(separator)
+        first = False
+
+        encoded = codec.dumps(item)
+        chunk.append(encoded)
+        size += len(encoded)
+
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+
+    if format != 'ndjson' or not first:
+        chunk.append(end)
+    yield ''.join(chunk)
+
+
+def file_body(path, chunk_size=CHUNK_SIZE):
+    """Returns the `body` callback of rules streaming the `path` file."""
+    def body(request, context):
+        return IterStream(iter_file(path, chunk_size=chunk_size))
+    return body
+
+
+def stream_body(func):
+    """Returns the `body` callback of rules streaming the chunks `func`
+    returns, called as a `text` callback.
+    """
+    def body(request, context):
+        return IterStream(func(request, context))
+    return body
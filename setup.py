@@ -36,11 +36,23 @@ setup(
     url='https://github.com/novafloss/mock-services',
     license='MIT',
     install_requires=[
-        'attrs',
+        'attrs>=20.1.0',
         'funcsigs',
         'requests-mock>=1.2.0',
     ],
     extras_require={
+        'aiohttp': [
+            'aiohttp'
+        ],
+        'fast': [
+            'orjson'
+        ],
+        'httpx': [
+            'httpx'
+        ],
+        'yaml': [
+            'PyYAML'
+        ],
         'test': [
             'flake8'
         ],
@@ -0,0 +1,198 @@
+import json
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import asyncio
+except ImportError:
+    # Python 2
+    asyncio = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from mock_services import http_mock
+from mock_services import reset_rules
+from mock_services import update_http_rules
+from mock_services import update_rest_rules
+from mock_services import storage
+
+
+CONTENTTYPE_JSON = {'Content-Type': 'application/json'}
+
+rest_rules = [
+    {
+        'method': 'LIST',
+        'url': r'^https://my_fake_service/(?P<resource>api)$'
+    },
+    {
+        'method': 'GET',
+        'url': r'^https://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+    },
+    {
+        'method': 'POST',
+        'url': r'^https://my_fake_service/(?P<resource>api)$',
+        'id_factory': int,
+    },
+    {
+        'method': 'DELETE',
+        'url': r'^https://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+    },
+]
+
+
+class AsyncMockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        reset_rules()
+        storage.reset()
+        update_rest_rules(rest_rules)
+
+    tearDown = setUp
+
+    def check_crud(self, request):
+        status, body = request('POST', 'https://my_fake_service/api',
+                               {'foo': 'bar'})
+        self.assertEqual(status, 201)
+        self.assertEqual(json.loads(body), {'id': 1, 'foo': 'bar'})
+
+        status, body = request('GET', 'https://my_fake_service/api/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'id': 1, 'foo': 'bar'})
+
+        self.assertEqual(http_mock._http_adapter.last_request.url,
+                         'https://my_fake_service/api/1')
+
+        status, body = request('GET', 'https://my_fake_service/api')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), [{'id': 1, 'foo': 'bar'}])
+
+        status, _ = request('DELETE', 'https://my_fake_service/api/1')
+        self.assertEqual(status, 204)
+
+        status, _ = request('GET', 'https://my_fake_service/api/1')
+        self.assertEqual(status, 404)
+
+    @unittest.skipIf(httpx is None, 'httpx is required')
+    def test_httpx(self):
+        from mock_services.httpx_mock import MockTransport
+
+        client = httpx.Client(transport=MockTransport())
+        self.addCleanup(client.close)
+
+        def request(method, url, data=None):
+            response = client.request(
+                method, url, headers=CONTENTTYPE_JSON,
+                content=data and json.dumps(data))
+            return response.status_code, response.text
+
+        self.check_crud(request)
+
+        self.assertRaises(httpx.ConnectError, client.get,
+                          'https://my_fake_service/other')
+
+        # real transport for unknown urls
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^https://other_service/$',
+            'text': 'Coincoin!',
+        }])
+        client = httpx.Client(transport=MockTransport(
+            passthrough=MockTransport()))
+        self.addCleanup(client.close)
+        self.assertEqual(client.get('https://other_service/').text,
+                         'Coincoin!')
+
+    @unittest.skipIf(httpx is None, 'httpx is required')
+    def test_httpx_async(self):
+        from mock_services.httpx_mock import AsyncMockTransport
+
+        async def request(method, url, data=None):
+            async with httpx.AsyncClient(
+                    transport=AsyncMockTransport()) as client:
+                response = await client.request(
+                    method, url, headers=CONTENTTYPE_JSON,
+                    content=data and json.dumps(data))
+            return response.status_code, response.text
+
+        self.check_crud(
+            lambda *args: asyncio.run(request(*args)))
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is required')
+    def test_aiohttp(self):
+        from mock_services.aiohttp_mock import MockConnector
+
+        async def request(method, url, data=None):
+            async with aiohttp.ClientSession(
+                    connector=MockConnector()) as session:
+                async with session.request(method, url, json=data) as r:
+                    return r.status, await r.text()
+
+        self.check_crud(
+            lambda *args: asyncio.run(request(*args)))
+
+        async def refused():
+            async with aiohttp.ClientSession(
+                    connector=MockConnector()) as session:
+                await session.get('https://my_fake_service/other')
+
+        self.assertRaises(aiohttp.ClientConnectionError,
+                          asyncio.run, refused())
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is required')
+    def test_aiohttp_keep_alive(self):
+        from mock_services.aiohttp_mock import MockConnector
+
+        async def requests():
+            connector = MockConnector()
+            async with aiohttp.ClientSession(connector=connector) as session:
+                statuses = []
+                for _ in range(3):
+                    async with session.get(
+                            'https://my_fake_service/api') as r:
+                        await r.read()
+                        statuses.append(r.status)
+                return statuses, len(connector._conns)
+
+        self.assertEqual(asyncio.run(requests()), ([200, 200, 200], 1))
+
+    @unittest.skipIf(aiohttp is None, 'aiohttp is required')
+    def test_aiohttp_executor(self):
+        from mock_services.aiohttp_mock import MockConnector
+
+        executor = ThreadPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+
+        threads = set()
+
+        def callback(request, context):
+            threads.add(threading.current_thread())
+            return 'Coincoin!'
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^https://other_service/$',
+            'text': callback,
+        }])
+
+        async def request(method, url, data=None):
+            async with aiohttp.ClientSession(
+                    connector=MockConnector(executor=executor)) as session:
+                async with session.request(method, url, json=data) as r:
+                    return r.status, await r.text()
+
+        self.check_crud(
+            lambda *args: asyncio.run(request(*args)))
+
+        self.assertEqual(asyncio.run(request('GET', 'https://other_service/')),
+                         (200, 'Coincoin!'))
+        self.assertNotIn(threading.main_thread(), threads)
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+
+import requests
+
+from mock_services import http_mock
+from mock_services import reset_rules
+from mock_services import start_http_mock
+from mock_services import stop_http_mock
+from mock_services import update_http_rules
+from mock_services.cassettes import Cassette
+from mock_services.cassettes import record
+from mock_services.cassettes import replay
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    hits = 0
+
+    def do_GET(self):
+        Handler.hits += 1
+        if self.path == '/binary':
+            body = b'\xff\x00'
+        else:
+            body = 'hit {0}'.format(Handler.hits).encode('utf-8')
+        self.send_response(200)
+        self.send_header('X-Path', self.path)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CassettesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stop_http_mock()
+        reset_rules()
+
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'cassette')
+
+        Handler.hits = 0
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def tearDown(self):
+        stop_http_mock()
+        reset_rules()
+
+    def test_record_replay(self):
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/$',
+            'text': 'Coincoin!',
+        }])
+
+        with record(self.path):
+            # mocked, not recorded
+            self.assertEqual(requests.get('http://my_fake_service/').text,
+                             'Coincoin!')
+
+            self.assertEqual(requests.get(self.url + '/a').text, 'hit 1')
+            self.assertEqual(requests.get(self.url + '/a').text, 'hit 2')
+            self.assertEqual(requests.get(self.url + '/b').text, 'hit 3')
+            self.assertEqual(requests.get(self.url + '/binary').content,
+                             b'\xff\x00')
+
+        self.assertFalse(http_mock.is_started())
+        self.assertEqual(Handler.hits, 4)
+
+        self.assertTrue(start_http_mock())
+        cassette = replay(self.path)
+        self.addCleanup(cassette.close)
+        self.assertEqual(cassette.count, 4)
+
+        # replayed in order, then the last one
+        for text in ['hit 1', 'hit 2', 'hit 2']:
+            response = requests.get(self.url + '/a')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.text, text)
+            self.assertEqual(response.headers['X-Path'], '/a')
+
+        self.assertEqual(requests.get(self.url + '/b').text, 'hit 3')
+        self.assertEqual(requests.get(self.url + '/binary').content,
+                         b'\xff\x00')
+        self.assertEqual(Handler.hits, 4)
+
+        # not recorded, nor cached
+        for path in ['/c', '/d']:
+            self.assertRaises(requests.ConnectionError, requests.get,
+                              self.url + path)
+        self.assertEqual(len(cassette._records), 3)
+
+    def test_record_allow_external(self):
+
+        self.assertTrue(start_http_mock())
+        http_mock.set_allow_external(True)
+        self.addCleanup(http_mock.set_allow_external, False)
+
+        with record(self.path):
+            requests.get(self.url + '/a')
+
+        self.assertTrue(http_mock.get_allow_external())
+        self.assertEqual(requests.get(self.url + '/a').text, 'hit 2')
+
+    def test_invalid(self):
+
+        with open(self.path, 'wb') as f:
+            f.write(b'{}' * 20)
+
+        self.assertRaises(ValueError, Cassette, self.path)
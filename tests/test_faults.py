@@ -0,0 +1,147 @@
+import json
+import unittest
+
+import requests
+
+from mock_services import clock
+from mock_services import faults
+from mock_services import reset_rules
+from mock_services import restore_rules
+from mock_services import snapshot_rules
+from mock_services import start_http_mock
+from mock_services import stop_http_mock
+from mock_services import update_rest_rules
+
+
+def get_rules(rule_faults, **kwargs):
+    return [
+        dict({
+            'method': 'GET',
+            'url': r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+            'faults': rule_faults,
+        }, **kwargs),
+        {
+            'method': 'POST',
+            'url': r'^http://my_fake_service/(?P<resource>api)$',
+            'id_factory': int,
+        },
+    ]
+
+
+class FaultsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stop_http_mock()
+        reset_rules()
+        clock.set_virtual(True)
+        faults.seed(42)
+
+    def tearDown(self):
+        stop_http_mock()
+        reset_rules()
+        clock.set_virtual(False)
+
+    def add_resource(self):
+        self.assertTrue(start_http_mock())
+        response = requests.post('http://my_fake_service/api',
+                                 data=json.dumps({'foo': 'bar'}),
+                                 headers={'content-type': 'application/json'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_every(self):
+
+        update_rest_rules(get_rules([
+            {'every': 3, 'status_code': 429, 'headers': {'Retry-After': '1'}},
+        ]))
+        self.add_resource()
+
+        codes = []
+        for _ in range(6):
+            response = requests.get('http://my_fake_service/api/1')
+            codes.append(response.status_code)
+        self.assertEqual(codes, [200, 200, 429, 200, 200, 429])
+
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(response.json(), {'error': 'Too Many Requests'})
+
+    def test_restore_rules(self):
+
+        update_rest_rules(get_rules([{'every': 2, 'status_code': 503}]))
+        self.add_resource()
+        snapshot = snapshot_rules()
+
+        for count in [3, 2]:
+            restore_rules(snapshot)
+            codes = [requests.get('http://my_fake_service/api/1').status_code
+                     for _ in range(count)]
+            self.assertEqual(codes, [200, 503, 200][:count])
+
+    def test_probability(self):
+
+        update_rest_rules(get_rules([
+            {'probability': 0.25, 'status_code': 503},
+        ]))
+        self.add_resource()
+
+        def get_codes():
+            faults.seed(1)
+            return [requests.get('http://my_fake_service/api/1').status_code
+                    for _ in range(400)]
+
+        codes = get_codes()
+        self.assertEqual(set(codes), set([200, 503]))
+        self.assertTrue(50 < codes.count(503) < 150)
+        self.assertEqual(get_codes(), codes)
+
+    def test_reset(self):
+
+        update_rest_rules(get_rules([{'every': 2, 'reset': True}]))
+        self.add_resource()
+
+        self.assertEqual(
+            requests.get('http://my_fake_service/api/1').status_code, 200)
+        with self.assertRaises(requests.ConnectionError) as cm:
+            requests.get('http://my_fake_service/api/1')
+        self.assertEqual(
+            str(cm.exception),
+            'Connection reset by peer: GET http://my_fake_service/api/1')
+
+    def test_truncate(self):
+
+        update_rest_rules(get_rules([{'every': 2, 'truncate': 5}]))
+        self.add_resource()
+
+        response = requests.get('http://my_fake_service/api/1')
+        self.assertEqual(response.json(), {'id': 1, 'foo': 'bar'})
+
+        self.assertRaises(requests.exceptions.ChunkedEncodingError,
+                          requests.get, 'http://my_fake_service/api/1')
+
+        requests.get('http://my_fake_service/api/1')
+        response = requests.get('http://my_fake_service/api/1', stream=True)
+        self.assertRaises(requests.exceptions.ChunkedEncodingError,
+                          lambda: response.content)
+
+    def test_delay(self):
+
+        update_rest_rules(get_rules([{'every': 2, 'delay': 5}]))
+        self.add_resource()
+
+        requests.get('http://my_fake_service/api/1')
+        self.assertEqual(clock.now(), 0)
+
+        self.assertRaises(requests.ReadTimeout, requests.get,
+                          'http://my_fake_service/api/1', timeout=1)
+        self.assertEqual(clock.now(), 1)
+
+    def test_invalid(self):
+
+        for fault in [{'status_code': 503},
+                      {'every': 2, 'probability': 0.1, 'reset': True},
+                      {'every': 2}]:
+            self.assertRaises(ValueError, update_rest_rules,
+                              get_rules([fault]))
+
+        self.assertRaises(ValueError, update_rest_rules,
+                          get_rules([{'every': 2, 'truncate': 1}],
+                                    json={'foo': 'bar'}))
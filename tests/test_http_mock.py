@@ -1,4 +1,8 @@
 import logging
+import os
+import re
+import tempfile
+import threading
 import unittest
 
 import requests
@@ -233,3 +237,216 @@ class HttpTestCase(unittest.TestCase):
         response = requests.get('https://www.google.com/#q=mock-services')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content[:15], b'<!doctype html>')
+
+    def test_streamed_rules(self):
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'x' * 200000)
+
+        def chunks_cb(request, context):
+            context.status_code = 206
+            return (str(i) for i in range(3))
+
+        update_http_rules([
+            {
+                'method': 'GET',
+                'url': r'^https://my_service/export$',
+                'file': path,
+            },
+            {
+                'method': 'GET',
+                'url': r'^https://my_service/chunks$',
+                'stream': chunks_cb,
+            },
+        ])
+        self.assertTrue(start_http_mock())
+
+        response = requests.get('https://my_service/export', stream=True)
+        self.assertEqual(response.headers['Content-Type'], 'text/csv')
+        chunks = list(response.iter_content(65536))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b''.join(chunks), b'x' * 200000)
+
+        # not consumed by the first request
+        response = requests.get('https://my_service/export')
+        self.assertEqual(len(response.content), 200000)
+
+        response = requests.get('https://my_service/chunks')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.text, '012')
+
+    def test_rules_precedence(self):
+
+        update_http_rules([
+            {
+                'method': 'GET',
+                'text': 'any host',
+                'url': r'http://',
+            },
+            {
+                'method': 'GET',
+                'text': 'dummy',
+                'url': r'^http://dummy/',
+            },
+            {
+                'method': 'GET',
+                'text': 'dummy api',
+                'url': r'^http://dummy/api/\d+$',
+            },
+            {
+                'method': 'POST',
+                'text': 'dummy api post',
+                'url': r'^http://dummy/api/\d+$',
+            },
+        ])
+        self.assertTrue(start_http_mock())
+
+        response = requests.get('http://dummy/api/1')
+        self.assertEqual(response.content, b'dummy api')
+
+        response = requests.post('http://dummy/api/1')
+        self.assertEqual(response.content, b'dummy api post')
+
+        response = requests.get('http://dummy/other')
+        self.assertEqual(response.content, b'dummy')
+
+        response = requests.get('http://another/api/1')
+        self.assertEqual(response.content, b'any host')
+
+        # last added rule wins
+        update_http_rules([
+            {
+                'method': 'GET',
+                'text': 'overridden',
+                'url': r'^http://dummy/api/1$',
+            },
+        ])
+
+        response = requests.get('http://dummy/api/1')
+        self.assertEqual(response.content, b'overridden')
+
+        response = requests.get('http://dummy/api/2')
+        self.assertEqual(response.content, b'dummy api')
+
+        # rules removed in place are not matched anymore
+        http_mock.get_rules().pop()
+
+        response = requests.get('http://dummy/api/1')
+        self.assertEqual(response.content, b'dummy api')
+
+        # even when another rule is registered at the same position
+        http_mock.get_rules().pop()
+        update_http_rules([
+            {
+                'method': 'GET',
+                'text': 'dummy other',
+                'url': r'^http://dummy/other$',
+            },
+        ])
+
+        response = requests.get('http://dummy/other')
+        self.assertEqual(response.content, b'dummy other')
+
+        # popped
+        self.assertRaises(requests.ConnectionError, requests.post,
+                          'http://dummy/api/1')
+
+    def test_indexed_rules(self):
+
+        update_http_rules([
+            {
+                'method': 'GET',
+                'text': 'host {0}'.format(i),
+                'url': r'^http://host{0}/api/(?P<id>\d+)$'.format(i),
+            }
+            for i in range(100)
+        ])
+        self.assertTrue(start_http_mock())
+
+        response = requests.get('http://host42/api/1')
+        self.assertEqual(response.content, b'host 42')
+
+        # only rules of the requested host are tried
+        request = http_mock._http_adapter.last_request
+        self.assertEqual(
+            http_mock._http_adapter._get_candidates(request),
+            [http_mock.get_rules()[42]],
+        )
+
+        self.assertRaises(ConnectionError, requests.get,
+                          'http://host100/api/1')
+
+    def test_dispatch_history(self):
+
+        barrier = threading.Barrier(2)
+        first_done = threading.Event()
+
+        def callback(request, context):
+            # both requests are matched, the first one answers first
+            barrier.wait()
+            if request.path == '/second':
+                first_done.wait()
+            return request.path
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/',
+            'text': callback,
+        }])
+
+        adapter = http_mock._http_adapter
+
+        def dispatch(path):
+            response = adapter.dispatch(
+                'GET', 'http://my_fake_service' + path, keep_history=False)
+            self.assertEqual(response.text, path)
+            if path == '/first':
+                first_done.set()
+
+        threads = [threading.Thread(target=dispatch, args=(path,))
+                   for path in ['/first', '/second']]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(adapter.request_history, [])
+        self.assertEqual(http_mock.get_rules()[0].request_history, [])
+
+        adapter.dispatch('GET', 'http://my_fake_service/kept')
+        self.assertEqual(adapter.last_request.path, '/kept')
+        self.assertEqual(len(http_mock.get_rules()[0].request_history), 1)
+
+    def test_url_prefix(self):
+
+        for pattern, prefix in [
+            (r'^http://host/(?P<resource>api)/(?P<id>\d+)$', 'http://host/'),
+            (r'^https://www\.host\.com/#q=', 'https://www.host.com/'),
+            (r'^https:\/\/host\/api\/v1', 'https://host/api/'),
+            (r'\Ahttp://host/api/v1', 'http://host/api/'),
+            (r'^http://host/api/v1/?', 'http://host/api/'),
+            (r'^http://host/api/v1/x?', 'http://host/api/v1/'),
+            (r'^http://host/api/v1\/x?', 'http://host/api/v1/'),
+            (r'^http://host/api/v1\.?/', 'http://host/api/'),
+            (r'^http://host/(api|other)/', 'http://host/'),
+            (r'^http://[a-z]+/', 'http://'),
+            (r'^http://host/api|^http://other/', None),
+            (r'(?i)^http://host/', None),
+            (r'http://host/', None),
+            (r'^/api/', None),
+        ]:
+            self.assertEqual(
+                http_mock.get_url_prefix(re.compile(pattern)), prefix)
+            self.assertEqual(
+                http_mock.get_url_prefix(http_mock.LazyRegex(pattern)),
+                prefix)
+
+        self.assertIsNone(http_mock.get_url_prefix(
+            re.compile(r'^http://host/', re.I)))
+
+        # not compiled
+        regex = http_mock.LazyRegex(r'^http://host/api/(?P<id>\d+)$')
+        self.assertEqual(http_mock.get_url_prefix(regex), 'http://host/api/')
+        self.assertIsNone(regex._regex)
@@ -0,0 +1,209 @@
+import os
+import tempfile
+import unittest
+
+import requests
+
+from mock_services import clock
+from mock_services import latency
+from mock_services import reset_rules
+from mock_services import start_http_mock
+from mock_services import stop_http_mock
+from mock_services import update_http_rules
+from mock_services import update_rest_rules
+
+
+class LatencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stop_http_mock()
+        reset_rules()
+        clock.set_virtual(True)
+
+    def tearDown(self):
+        stop_http_mock()
+        reset_rules()
+        clock.set_virtual(False)
+
+    def test_rule_profile(self):
+
+        update_http_rules([
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/slow$',
+                'text': 'x' * 1000,
+                'latency': {'latency': 0.5, 'bandwidth': 1000},
+            },
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/fast$',
+                'text': 'Coincoin!',
+            },
+        ])
+
+        self.assertTrue(start_http_mock())
+
+        response = requests.get('http://my_fake_service/slow')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(clock.now(), 1.5)
+
+        requests.get('http://my_fake_service/fast')
+        self.assertEqual(clock.now(), 1.5)
+
+    def test_host_profile(self):
+
+        update_rest_rules([
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',  # noqa
+            },
+            {
+                'method': 'LIST',
+                'url': r'^http://my_fake_service/(?P<resource>api)$',
+                'latency': latency.Profile(latency=1),
+            },
+        ])
+
+        latency.set_host_profile('my_fake_service', latency=0.25)
+
+        self.assertTrue(start_http_mock())
+
+        self.assertEqual(
+            requests.get('http://my_fake_service/api/1').status_code, 404)
+        self.assertEqual(clock.now(), 0.25)
+
+        # rule profile first
+        self.assertEqual(
+            requests.get('http://my_fake_service/api').status_code, 200)
+        self.assertEqual(clock.now(), 1.25)
+
+        latency.set_host_profile('my_fake_service', None)
+        requests.get('http://my_fake_service/api/1')
+        self.assertEqual(clock.now(), 1.25)
+
+    def test_reset_rules(self):
+
+        update_http_rules([
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/slow$',
+                'text': 'Coincoin!',
+            },
+        ])
+        latency.set_host_profile('my_fake_service', latency=1)
+
+        reset_rules()
+        update_http_rules([
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/slow$',
+                'text': 'Coincoin!',
+            },
+        ])
+
+        self.assertTrue(start_http_mock())
+
+        requests.get('http://my_fake_service/slow')
+        self.assertEqual(clock.now(), 0)
+
+    def test_stream(self):
+
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'x' * 100000)
+
+        profile = {'latency': 0.5, 'bandwidth': 10000}
+        update_http_rules([
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/file$',
+                'file': path,
+                'latency': profile,
+            },
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/text$',
+                'text': 'x' * 100000,
+                'latency': profile,
+            },
+        ])
+
+        self.assertTrue(start_http_mock())
+
+        for url in ['http://my_fake_service/file',
+                    'http://my_fake_service/text']:
+            clock.set_virtual(True)
+            response = requests.get(url, stream=True)
+            self.assertEqual(clock.now(), 0.5)
+
+            chunk = next(response.iter_content(10000))
+            self.assertEqual(len(chunk), 10000)
+            self.assertEqual(clock.now(), 1.5)
+
+            size = len(chunk) + sum(len(chunk) for chunk in
+                                    response.iter_content(10000))
+            self.assertEqual(size, 100000)
+            self.assertAlmostEqual(clock.now(), 10.5)
+
+    def test_jitter(self):
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/$',
+            'text': 'Coincoin!',
+            'latency': {'latency': 1, 'jitter': 0.5},
+        }])
+
+        self.assertTrue(start_http_mock())
+
+        def get_delays():
+            latency.seed(42)
+            delays = []
+            for _ in range(10):
+                clock.set_virtual(True)
+                requests.get('http://my_fake_service/')
+                delays.append(clock.now())
+            return delays
+
+        delays = get_delays()
+        self.assertTrue(all(0.5 <= delay <= 1.5 for delay in delays))
+        self.assertTrue(len(set(delays)) > 1)
+        self.assertEqual(get_delays(), delays)
+
+    def test_timeout(self):
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/$',
+            'text': 'Coincoin!',
+            'latency': {'latency': 2},
+        }])
+
+        self.assertTrue(start_http_mock())
+
+        self.assertRaises(requests.ReadTimeout, requests.get,
+                          'http://my_fake_service/', timeout=1)
+        self.assertEqual(clock.now(), 1)
+
+        response = requests.get('http://my_fake_service/', timeout=(1, 3))
+        self.assertEqual(response.text, 'Coincoin!')
+        self.assertEqual(clock.now(), 3)
+
+    def test_real_clock(self):
+
+        clock.set_virtual(False)
+        self.assertRaises(RuntimeError, clock.advance, 1)
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/$',
+            'text': 'Coincoin!',
+            'latency': {'latency': 0.05},
+        }])
+
+        self.assertTrue(start_http_mock())
+
+        start = clock.now()
+        requests.get('http://my_fake_service/')
+        self.assertTrue(clock.now() - start >= 0.05)
@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from mock_services import http_mock
+from mock_services import load_rules_file
+from mock_services import reset_rules
+from mock_services import start_http_mock
+from mock_services import stop_http_mock
+from mock_services.exceptions import Http400
+from mock_services.loaders import read_rules_file
+
+
+CONTENTTYPE_JSON = {'Content-Type': 'application/json'}
+
+RULES_YAML = r'''
+http:
+  - method: GET
+    url: ^https://duckduckgo\.com/\?q=
+    text: Coincoin!
+rest:
+  - method: LIST
+    url: ^http://my_fake_service/(?P<resource>api)(\?|$)
+    indexes: [email]
+  - method: GET
+    url: ^http://my_fake_service/(?P<resource>api)/(?P<id>\w+-\w+-\w+-\w+-\w+)$
+  - method: POST
+    url: ^http://my_fake_service/(?P<resource>api)$
+    id_factory: uuid
+    attrs:
+      email: {}
+      active: {default: true}
+    validators:
+      - tests.test_loaders:should_not_be_admin
+'''
+
+
+def should_not_be_admin(request):
+    if json.loads(request.body).get('email') == 'admin':
+        raise Http400
+
+
+class LoadersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stop_http_mock()
+        reset_rules()
+
+    tearDown = setUp
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _setup_tmp_dir(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_load_rules_file(self):
+
+        self._setup_tmp_dir()
+        path = self._write('rules.yml', RULES_YAML)
+
+        report = load_rules_file(path)
+        self.assertEqual(report.count, 4)
+        self.assertTrue(os.path.exists(path + '.cache'))
+
+        # route metadata
+        matcher = http_mock.get_rules()[0]
+        self.assertEqual(matcher._url.url_prefix, 'https://duckduckgo.com/')
+        self.assertTrue(matcher._url._regex is None)
+
+        self.assertTrue(start_http_mock())
+
+        r = requests.get('https://duckduckgo.com/?q=mock-services')
+        self.assertEqual(r.content, b'Coincoin!')
+
+        r = requests.post('http://my_fake_service/api',
+                          data=json.dumps({'email': 'admin'}),
+                          headers=CONTENTTYPE_JSON)
+        self.assertEqual(r.status_code, 400)
+
+        r = requests.post('http://my_fake_service/api',
+                          data=json.dumps({'email': 'a@b.c'}),
+                          headers=CONTENTTYPE_JSON)
+        self.assertEqual(r.status_code, 201)
+        id = r.json()['id']
+
+        r = requests.get('http://my_fake_service/api/' + id)
+        self.assertEqual(r.json(), {'id': id, 'email': 'a@b.c'})
+
+        r = requests.get('http://my_fake_service/api?email=a@b.c')
+        self.assertEqual(r.json(), [{'id': id, 'email': 'a@b.c'}])
+
+    def test_cache(self):
+
+        self._setup_tmp_dir()
+        path = self._write('rules.json', json.dumps({
+            'http': [{'method': 'GET', 'url': r'^http://dummy/', 'text': ''}],
+        }))
+
+        data = read_rules_file(path)
+        self.assertEqual(data['http'][0]['route'], {
+            'prefix': 'http://dummy/',
+            'groups': [],
+            'hostname': 'dummy',
+        })
+
+        # cache is reused while the file does not change
+        with open(path + '.cache') as f:
+            cached = json.load(f)
+        cached['rules']['http'] = []
+        self._write('rules.json.cache', json.dumps(cached))
+
+        self.assertEqual(read_rules_file(path)['http'], [])
+        self.assertEqual(read_rules_file(path, cache=False), data)
+
+        self._write('rules.json', json.dumps({'rest': []}))
+        self.assertEqual(read_rules_file(path), {'http': [], 'rest': []})
+
+    def test_cache_not_serializable(self):
+
+        self._setup_tmp_dir()
+        path = self._write('rules.yml', RULES_YAML.replace(
+            'default: true', 'default: 2020-01-01'))
+
+        # loaded without cache
+        report = load_rules_file(path)
+        self.assertEqual(report.count, 4)
+        self.assertEqual(os.listdir(self.tmp_dir), ['rules.yml'])
+
+    def test_invalid_rules(self):
+
+        self._setup_tmp_dir()
+
+        path = self._write('rules.json', json.dumps({'other': []}))
+        self.assertRaises(ValueError, load_rules_file, path)
+
+        path = self._write('rules.json', json.dumps({
+            'rest': [{'method': 'INVALID', 'url': r'^http://dummy/'}],
+        }))
+        self.assertRaises(NotImplementedError, load_rules_file, path)
@@ -0,0 +1,108 @@
+import json
+import unittest
+
+import requests
+
+from mock_services import metrics
+from mock_services import reset_rules
+from mock_services import start_http_mock
+from mock_services import stop_http_mock
+from mock_services import update_http_rules
+from mock_services import update_rest_rules
+
+
+rest_rules = [
+    {
+        'method': 'GET',
+        'url': r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+    },
+    {
+        'method': 'POST',
+        'url': r'^http://my_fake_service/(?P<resource>api)$',
+        'id_factory': int,
+    },
+]
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stop_http_mock()
+        reset_rules()
+        metrics.disable()
+        metrics.reset()
+
+    tearDown = setUp
+
+    def test_disabled(self):
+
+        self.assertTrue(start_http_mock())
+
+        update_rest_rules(rest_rules)
+        requests.get('http://my_fake_service/api/1')
+
+        self.assertEqual(metrics.as_dict()['hits'], {})
+        self.assertEqual(metrics.as_dict()['storage'], {})
+
+    def test_metrics(self):
+
+        metrics.enable()
+        self.assertTrue(start_http_mock())
+
+        update_rest_rules(rest_rules)
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://other_service/$',
+            'text': 'Coincoin!',
+        }])
+
+        requests.post('http://my_fake_service/api',
+                      data=json.dumps({'foo': 'bar'}),
+                      headers={'Content-Type': 'application/json'})
+        requests.get('http://my_fake_service/api/1')
+        requests.get('http://my_fake_service/api/2')
+        requests.get('http://other_service/')
+
+        self.assertRaises(requests.ConnectionError, requests.get,
+                          'http://my_fake_service/other?q=1')
+
+        data = metrics.as_dict()
+
+        self.assertEqual(data['hits'], {
+            'GET ^http://my_fake_service/(?P<resource>api)/(?P<id>\\d+)$': 2,
+            'POST ^http://my_fake_service/(?P<resource>api)$': 1,
+            'GET ^http://other_service/$': 1,
+        })
+        self.assertEqual(data['misses'],
+                         {'GET http://my_fake_service/other': 1})
+        self.assertEqual(data['storage'], {
+            'add': 1,
+            'get_json': 2,
+            'next_id': 1,
+        })
+
+        self.assertEqual(data['latency']['match']['count'], 4)
+        self.assertEqual(data['latency']['response']['count'], 4)
+        self.assertEqual(data['latency']['callback']['count'], 3)
+        # POST and 404 error, resources are encoded by the storage
+        self.assertEqual(data['latency']['serialize']['count'], 2)
+        self.assertEqual(data['latency']['match']['buckets']['+Inf'], 4)
+
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE mock_services_rule_hits_total counter\n', text)
+        self.assertIn('mock_services_rule_hits_total{method="GET",'
+                      'url="^http://other_service/$"} 1\n', text)
+        self.assertIn('mock_services_rule_hits_total{method="GET",url="'
+                      '^http://my_fake_service/(?P<resource>api)/'
+                      '(?P<id>\\\\d+)$"} 2\n', text)
+        self.assertIn('mock_services_misses_total{method="GET",'
+                      'url="http://my_fake_service/other"} 1\n', text)
+        self.assertIn('mock_services_storage_operations_total{'
+                      'operation="add"} 1\n', text)
+        self.assertIn('mock_services_latency_seconds_count{'
+                      'stage="match"} 4\n', text)
+        self.assertIn('mock_services_latency_seconds_bucket{'
+                      'stage="match",le="+Inf"} 4\n', text)
+
+        metrics.reset()
+        self.assertEqual(metrics.as_dict()['hits'], {})
@@ -0,0 +1,154 @@
+import json
+import threading
+import unittest
+
+import requests
+
+from mock_services import clock
+from mock_services import http_mock
+from mock_services import ratelimits
+from mock_services import reset_rules
+from mock_services import restore_rules
+from mock_services import snapshot_rules
+from mock_services import start_http_mock
+from mock_services import stop_http_mock
+from mock_services import update_rest_rules
+
+
+def get_rules(rate_limit):
+    return [
+        {
+            'method': 'GET',
+            'url': r'^http://my_fake_service/(?P<resource>api|other)/(?P<id>\d+)$',  # noqa
+            'rate_limit': rate_limit,
+        },
+        {
+            'method': 'POST',
+            'url': r'^http://my_fake_service/(?P<resource>api|other)$',
+            'id_factory': int,
+        },
+    ]
+
+
+class RateLimitsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stop_http_mock()
+        reset_rules()
+        clock.set_virtual(True)
+
+    def tearDown(self):
+        stop_http_mock()
+        reset_rules()
+        clock.set_virtual(False)
+
+    def add_resources(self):
+        self.assertTrue(start_http_mock())
+        for resource in ['api', 'other']:
+            response = requests.post(
+                'http://my_fake_service/{0}'.format(resource),
+                data=json.dumps({'foo': 'bar'}),
+                headers={'content-type': 'application/json'})
+            self.assertEqual(response.status_code, 201)
+
+    def get_codes(self, url, count):
+        return [requests.get(url).status_code for _ in range(count)]
+
+    def test_host(self):
+
+        update_rest_rules(get_rules({'rate': 2, 'burst': 3}))
+        self.add_resources()
+
+        url = 'http://my_fake_service/api/1'
+        self.assertEqual(self.get_codes(url, 4), [200, 200, 200, 429])
+
+        response = requests.get('http://my_fake_service/other/1')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(response.json(), {'error': 'Too Many Requests'})
+
+        # one token by 0.5s
+        clock.advance(0.5)
+        self.assertEqual(self.get_codes(url, 2), [200, 429])
+
+        # no more than burst
+        clock.advance(10)
+        self.assertEqual(self.get_codes(url, 4), [200, 200, 200, 429])
+
+        self.assertEqual(ratelimits.get_counts(), {
+            'my_fake_service': {'allowed': 7, 'throttled': 4},
+        })
+
+    def test_resource(self):
+
+        update_rest_rules(get_rules({'rate': 1, 'per': 'resource'}))
+        self.add_resources()
+
+        self.assertEqual(
+            self.get_codes('http://my_fake_service/api/1', 2), [200, 429])
+        self.assertEqual(
+            self.get_codes('http://my_fake_service/other/1', 2), [200, 429])
+
+    def test_threads(self):
+
+        update_rest_rules(get_rules({'rate': 1, 'burst': 10}))
+        self.add_resources()
+
+        codes = []
+
+        def get():
+            for _ in range(10):
+                codes.append(requests.get(
+                    'http://my_fake_service/api/1').status_code)
+
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(codes.count(200), 10)
+        self.assertEqual(codes.count(429), 30)
+
+    def test_dispatch_threads(self):
+
+        # as the server and async clients, without requests-mock lock
+        update_rest_rules(get_rules({'rate': 1, 'burst': 100}))
+        self.add_resources()
+
+        codes = []
+
+        def get():
+            for _ in range(100):
+                codes.append(http_mock.dispatch(
+                    'GET', 'http://my_fake_service/api/1',
+                    keep_history=False).status_code)
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(codes.count(200), 100)
+        self.assertEqual(ratelimits.get_counts(), {
+            'my_fake_service': {'allowed': 100, 'throttled': 700},
+        })
+
+    def test_restore_rules(self):
+
+        update_rest_rules(get_rules({'rate': 1, 'burst': 2}))
+        self.add_resources()
+        snapshot = snapshot_rules()
+
+        url = 'http://my_fake_service/api/1'
+        for _ in range(2):
+            restore_rules(snapshot)
+            self.assertEqual(self.get_codes(url, 3), [200, 200, 429])
+
+    def test_invalid(self):
+
+        for rate_limit in [{'rate': 0}, {'rate': 1, 'burst': 0},
+                           {'rate': 1, 'per': 'user'}]:
+            self.assertRaises(ValueError, update_rest_rules,
+                              get_rules(rate_limit))
@@ -9,7 +9,12 @@ import attr
 
 import requests
 
+from mock_services import json_codec
+from mock_services import load_rules
 from mock_services import reset_rules
+from mock_services import restore_rules
+from mock_services import set_json_codec
+from mock_services import snapshot_rules
 from mock_services import start_http_mock
 from mock_services import stop_http_mock
 from mock_services import update_rest_rules
@@ -18,6 +23,9 @@ from mock_services import storage
 from mock_services.exceptions import Http400
 from mock_services.exceptions import Http409
 from mock_services.service import ResourceContext
+from mock_services.service import compile_route
+from mock_services.service import make_validator
+from mock_services.service import validate_all
 
 
 CONTENTTYPE_JSON = {'Content-Type': 'application/json'}
@@ -125,8 +133,10 @@ class RestTestCase(unittest.TestCase):
         self.assertTrue(hasattr(matcher._url, 'match'))
         self.assertTrue(matcher._url.match(url_to_match))
 
+        # encoded bytes are answered as content
+        body = 'text' if method in ['DELETE', 'HEAD'] else 'content'
         response = matcher._responses[0]
-        self.assertTrue(hasattr(response._params['text'], '__call__'))
+        self.assertTrue(hasattr(response._params[body], '__call__'))
         self.assertEqual(response._params['headers']['Content-Type'], content_type)  # noqa
 
     def test_update_rules(self):
@@ -352,3 +362,291 @@ class RestTestCase(unittest.TestCase):
 
         r = requests.get('http://my_fake_service')
         self.assertEqual(r.content, b'Coincoin Content!')
+
+    def test_compile_route(self):
+
+        route = compile_route(r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$')  # noqa
+        self.assertEqual(route.hostname, 'my_fake_service')
+        self.assertEqual(route.groups, frozenset(['resource', 'id']))
+        self.assertEqual(route.get_hostname('http://my_fake_service/api/1'),
+                         'my_fake_service')
+        self.assertTrue(compile_route(route) is route)
+
+        # hostname is not literal
+        route = compile_route(r'^http://(my_fake_service|other)/(?P<resource>api)$')  # noqa
+        self.assertEqual(route.hostname, None)
+        self.assertEqual(route.get_hostname('http://other/api'), 'other')
+
+    def test_validate_all(self):
+
+        validator = make_validator({
+            'foo': attr.ib(),
+            'bar': attr.ib(),
+        })
+        self.assertTrue(make_validator(validator) is validator)
+        self.assertEqual(make_validator({}), None)
+
+        items = [{'foo': 1, 'bar': 2}, {'foo': 3, 'bar': 4, 'baz': 5}]
+        self.assertEqual(validate_all(items, validator), items)
+
+        # missing bar field
+        self.assertRaises(Http400, validate_all, items + [{'foo': 6}],
+                          validator)
+
+    def test_resource_context_key(self):
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api')
+        self.assertEqual(ctx.key, 'my_fake_service/api/default')
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api',
+                              action='download', id=1)
+        self.assertEqual(ctx.key, 'my_fake_service/api/download')
+        self.assertFalse(hasattr(ctx, '__dict__'))
+
+        # follows its fields
+        ctx.hostname = 'other_service'
+        ctx.resource = 'users'
+        ctx.action = 'default'
+        self.assertEqual(ctx.key, 'other_service/users/default')
+
+    def test_list_query(self):
+
+        url = 'http://my_fake_service/api'
+
+        update_rest_rules([
+            {
+                'method': 'LIST',
+                'url': r'^http://my_fake_service/(?P<resource>api)(\?|$)',
+                'filters': ['status'],
+            },
+            {
+                'method': 'POST',
+                'url': r'^http://my_fake_service/(?P<resource>api)$',
+            },
+        ])
+        self.assertTrue(start_http_mock())
+
+        for i, status in enumerate(['new', 'done', 'new', 'done', 'new']):
+            r = requests.post(url, data=json.dumps({
+                'status': status,
+                'rank': 5 - i,
+            }), headers=CONTENTTYPE_JSON)
+            self.assertEqual(r.status_code, 201)
+
+        r = requests.get(url, params={'limit': 2, 'offset': 1})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([o['id'] for o in r.json()], [2, 3])
+
+        r = requests.get(url, params={'status': 'new'})
+        self.assertEqual([o['id'] for o in r.json()], [1, 3, 5])
+
+        r = requests.get(url, params={'sort': 'rank', 'limit': 2})
+        self.assertEqual([o['id'] for o in r.json()], [5, 4])
+
+        r = requests.get(url, params={'sort': '-rank', 'status': 'done'})
+        self.assertEqual([o['id'] for o in r.json()], [2, 4])
+
+        # not a filter
+        r = requests.get(url, params={'rank': 1})
+        self.assertEqual(len(r.json()), 5)
+
+        r = requests.get(url, params={'limit': -1})
+        self.assertEqual(r.status_code, 400)
+
+    def test_list_stream(self):
+
+        update_rest_rules([
+            {
+                'method': 'LIST',
+                'url': r'^http://my_fake_service/(?P<resource>api)(\?|$)',
+                'stream': 'json',
+                'filters': ['status'],
+            },
+            {
+                'method': 'LIST',
+                'url': r'^http://my_fake_service/(?P<resource>ndjson)$',
+                'stream': 'ndjson',
+            },
+        ])
+        self.assertTrue(start_http_mock())
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.seed(api, ({'id': i, 'status': 'new' if i % 2 else 'done',
+                            'name': 'x' * 100} for i in range(2000)))
+
+        r = requests.get('http://my_fake_service/api', stream=True)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.headers['Content-Type'], 'application/json')
+        self.assertTrue(len(list(r.iter_content(65536))) > 1)
+
+        r = requests.get('http://my_fake_service/api')
+        self.assertEqual(r.json(), storage.to_list(api))
+
+        r = requests.get('http://my_fake_service/api',
+                         params={'status': 'new', 'offset': 1, 'limit': 2})
+        self.assertEqual([o['id'] for o in r.json()], [3, 5])
+
+        r = requests.get('http://my_fake_service/api',
+                         params={'limit': 'x'})
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json(), {'error': 'Bad Request'})
+
+        # empty
+        r = requests.get('http://my_fake_service/ndjson')
+        self.assertEqual(r.headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(r.text, '')
+
+        storage.seed(ResourceContext(hostname='my_fake_service',
+                                     resource='ndjson'),
+                     [{'id': 1}, {'id': 2}])
+        r = requests.get('http://my_fake_service/ndjson')
+        self.assertEqual(r.text, '{"id": 1}\n{"id": 2}\n')
+
+    def test_json_codec(self):
+
+        url = 'http://my_fake_service/api'
+
+        self.assertRaises(ValueError, update_rest_rules, [
+            {
+                'method': 'LIST',
+                'url': r'^http://my_fake_service/(?P<resource>api)$',
+                'codec': 'unknown',
+            },
+        ])
+
+        update_rest_rules([
+            {
+                'method': 'LIST',
+                'url': r'^http://my_fake_service/(?P<resource>api)$',
+                'codec': 'json',
+            },
+            {
+                'method': 'POST',
+                'url': r'^http://my_fake_service/(?P<resource>api)$',
+            },
+        ])
+        self.assertTrue(start_http_mock())
+        self.addCleanup(set_json_codec, 'json')
+
+        for codec in json_codec.CODECS:
+            set_json_codec(codec)
+            r = requests.post(url, data=json.dumps({'foo': codec}),
+                              headers=CONTENTTYPE_JSON)
+            self.assertEqual(r.status_code, 201)
+            self.assertEqual(r.json()['foo'], codec)
+
+        set_json_codec('fastest')
+        r = requests.get(url)
+        self.assertEqual(len(r.json()), len(json_codec.CODECS))
+
+    def test_load_rules(self):
+
+        url = 'http://my_fake_service/api'
+
+        report = load_rules(
+            http_rules=({
+                'method': 'GET',
+                'text': 'host {0}'.format(i),
+                'url': r'^http://host{0}/'.format(i),
+            } for i in range(10)),
+            rest_rules=iter(rest_rules),
+        )
+        self.assertEqual(report.count, 20)
+        self.assertTrue(report.duration >= 0)
+        self.assertEqual(len(http_mock.get_rules()), 20)
+
+        # compiled on first match
+        matcher = http_mock.get_rules()[3]
+        self.assertTrue(isinstance(matcher._url, http_mock.LazyRegex))
+        self.assertTrue(matcher._url._regex is None)
+
+        self.assertTrue(start_http_mock())
+
+        r = requests.get('http://host3/')
+        self.assertEqual(r.content, b'host 3')
+        self.assertFalse(matcher._url._regex is None)
+        self.assertTrue(http_mock.get_rules()[4]._url._regex is None)
+
+        r = requests.post(url, data=json.dumps({'bar': 'baz'}),
+                          headers=CONTENTTYPE_JSON)
+        self.assertEqual(r.status_code, 201)
+
+        r = requests.get(url + '/1')
+        self.assertEqual(r.json(), {'id': 1, 'bar': 'baz'})
+
+    def test_load_rules_route(self):
+
+        load_rules(rest_rules=[{
+            'method': 'GET',
+            'url': r'^http://lazy_service/(?P<resource>api)/(?P<id>\d+)$',
+        }])
+
+        # the rule and its callback share the regex compiled on first match
+        matcher = http_mock.get_rules()[0]
+        route = matcher._responses[0]._params['content'].keywords['url']
+        self.assertTrue(route.regex is matcher._url)
+        self.assertTrue(matcher._url._regex is None)
+        self.assertEqual(route.groups, frozenset(['resource', 'id']))
+        self.assertEqual(route.hostname, 'lazy_service')
+
+        self.assertTrue(start_http_mock())
+        r = requests.get('http://lazy_service/api/1')
+        self.assertEqual(r.status_code, 404)
+        self.assertFalse(matcher._url._regex is None)
+
+    def test_post_after_seed(self):
+
+        update_rest_rules(rest_rules)
+        self.assertTrue(start_http_mock())
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.seed(ctx, [{'id': 1, 'bar': 'a'}, {'id': 2, 'bar': 'b'}])
+
+        r = requests.post('http://my_fake_service/api',
+                          data=json.dumps({'bar': 'c'}),
+                          headers=CONTENTTYPE_JSON)
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json()['id'], 3)
+
+    def test_snapshot_rules(self):
+
+        url = 'http://my_fake_service/api'
+
+        update_rest_rules(rest_rules)
+        self.assertTrue(start_http_mock())
+
+        r = requests.post(url, data=json.dumps({'bar': 'seeded'}),
+                          headers=CONTENTTYPE_JSON)
+        self.assertEqual(r.status_code, 201)
+
+        snapshot = snapshot_rules()
+
+        # change everything
+        update_rest_rules([
+            {
+                'method': 'GET',
+                'url': r'^http://my_fake_service/(?P<resource>other)$',
+                'text': 'other',
+            },
+        ])
+        r = requests.patch(url + '/1', data=json.dumps({'bar': 'patched'}))
+        self.assertEqual(r.status_code, 200)
+        r = requests.post(url, data=json.dumps({'bar': 'added'}),
+                          headers=CONTENTTYPE_JSON)
+        self.assertEqual(r.json()['id'], 2)
+
+        for _ in range(2):
+            restore_rules(snapshot)
+
+            self.assertEqual(len(http_mock.get_rules()), 10)
+            self.assertRaises(requests.ConnectionError, requests.get,
+                              'http://my_fake_service/other')
+
+            r = requests.get(url)
+            self.assertEqual(r.json(), [{'id': 1, 'bar': 'seeded'}])
+
+            r = requests.delete(url + '/1')
+            self.assertEqual(r.status_code, 204)
+            r = requests.post(url, data=json.dumps({'bar': 'added'}),
+                              headers=CONTENTTYPE_JSON)
+            self.assertEqual(r.json()['id'], 2)
@@ -0,0 +1,237 @@
+import json
+import socket
+import threading
+import time
+import unittest
+
+try:
+    import asyncio
+    from http import client as http_client
+except ImportError:
+    # Python 2
+    asyncio = None
+
+from mock_services import http_mock
+from mock_services import reset_rules
+from mock_services import update_http_rules
+from mock_services import update_rest_rules
+from mock_services import storage
+
+
+CONTENTTYPE_JSON = {'Content-Type': 'application/json'}
+
+rest_rules = [
+    {
+        'method': 'LIST',
+        'url': r'^http://my_fake_service/(?P<resource>api)$'
+    },
+    {
+        'method': 'GET',
+        'url': r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+    },
+    {
+        'method': 'HEAD',
+        'url': r'^http://my_fake_service/(?P<resource>api)/(?P<id>\d+)$',
+    },
+    {
+        'method': 'POST',
+        'url': r'^http://my_fake_service/(?P<resource>api)$',
+        'id_factory': int,
+    },
+]
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is required')
+class ServerTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from mock_services.server import create_server
+
+        cls.loop = asyncio.new_event_loop()
+        cls.server = cls.loop.run_until_complete(create_server(
+            port=0, base_url='http://my_fake_service'))
+        cls.port = cls.server.sockets[0].getsockname()[1]
+        cls.thread = threading.Thread(target=cls.loop.run_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.server.close()
+        cls.loop.run_until_complete(cls.server.wait_closed())
+        cls.loop.close()
+
+    def setUp(self):
+        reset_rules()
+        storage.reset()
+        update_rest_rules(rest_rules)
+
+    tearDown = setUp
+
+    def request(self, connection, method, path, data=None):
+        connection.request(method, path, body=data and json.dumps(data),
+                           headers=CONTENTTYPE_JSON)
+        response = connection.getresponse()
+        return response.status, response.getheaders(), response.read()
+
+    def test_rest(self):
+
+        history = len(http_mock._http_adapter.request_history)
+
+        connection = http_client.HTTPConnection('127.0.0.1', self.port)
+        self.addCleanup(connection.close)
+
+        status, _, body = self.request(connection, 'POST', '/api',
+                                       {'foo': 'bar'})
+        self.assertEqual(status, 201)
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         {'id': 1, 'foo': 'bar'})
+
+        # same connection
+        status, _, body = self.request(connection, 'GET', '/api/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         {'id': 1, 'foo': 'bar'})
+
+        status, headers, body = self.request(connection, 'HEAD', '/api/1')
+        self.assertEqual(status, 200)
+        self.assertEqual(dict(headers)['id'], '1')
+        self.assertEqual(body, b'')
+
+        status, _, body = self.request(connection, 'GET', '/api')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         [{'id': 1, 'foo': 'bar'}])
+
+        status, _, _ = self.request(connection, 'GET', '/api/2')
+        self.assertEqual(status, 404)
+
+        # no rule
+        status, _, body = self.request(connection, 'GET', '/other')
+        self.assertEqual(status, 404)
+        self.assertEqual(body, b'No mock address: GET '
+                               b'http://my_fake_service/other')
+
+        # not kept by default
+        self.assertEqual(len(http_mock._http_adapter.request_history),
+                         history)
+
+    def test_proxy(self):
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://other_service/$',
+            'text': 'Coincoin!',
+        }])
+
+        connection = http_client.HTTPConnection('127.0.0.1', self.port)
+        self.addCleanup(connection.close)
+
+        status, _, body = self.request(connection, 'GET',
+                                       'http://other_service/')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'Coincoin!')
+
+    def test_pipelining(self):
+
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(sock.close)
+
+        sock.sendall(b'GET /api HTTP/1.1\r\nHost: x\r\n\r\n' * 2 +
+                     b'GET /api HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+
+        self.assertEqual(data.count(b'HTTP/1.1 200 OK'), 3)
+        self.assertTrue(data.endswith(b'Connection: close\r\n\r\n[]'))
+
+    def test_refuse_unknown(self):
+        from mock_services.server import create_server
+
+        server = asyncio.run_coroutine_threadsafe(create_server(
+            port=0, base_url='http://my_fake_service', refuse_unknown=True),
+            self.loop).result()
+        self.addCleanup(self.loop.call_soon_threadsafe, server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        connection = http_client.HTTPConnection('127.0.0.1', port)
+        self.addCleanup(connection.close)
+
+        status, _, _ = self.request(connection, 'GET', '/api')
+        self.assertEqual(status, 200)
+
+        self.assertRaises(http_client.RemoteDisconnected, self.request,
+                          connection, 'GET', '/other')
+
+    def test_body_error(self):
+
+        def chunks(request, context):
+            yield 'Coin'
+            raise ValueError('broken')
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/broken$',
+            'stream': chunks,
+        }])
+
+        connection = http_client.HTTPConnection('127.0.0.1', self.port)
+        self.addCleanup(connection.close)
+
+        status, _, body = self.request(connection, 'GET', '/broken')
+        self.assertEqual(status, 500)
+        self.assertEqual(body, b'')
+
+    def test_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from mock_services.server import create_server
+
+        executor = ThreadPoolExecutor(4)
+        self.addCleanup(executor.shutdown)
+
+        server = asyncio.run_coroutine_threadsafe(create_server(
+            port=0, base_url='http://my_fake_service', executor=executor),
+            self.loop).result()
+        self.addCleanup(self.loop.call_soon_threadsafe, server.close)
+        port = server.sockets[0].getsockname()[1]
+
+        def echo(request, context):
+            # first requests answered last
+            number = int(request.path.rsplit('/', 1)[1])
+            time.sleep((10 - number) * 0.005)
+            return '<{0}>'.format(number)
+
+        update_http_rules([{
+            'method': 'GET',
+            'url': r'^http://my_fake_service/echo/\d+$',
+            'text': echo,
+        }])
+
+        sock = socket.create_connection(('127.0.0.1', port))
+        self.addCleanup(sock.close)
+
+        # pipelined responses are written in requests order
+        sock.sendall(b''.join(
+            'GET /echo/{0} HTTP/1.1\r\n\r\n'.format(i).encode('ascii')
+            for i in range(10)) + b'GET /api HTTP/1.1\r\n'
+            b'Connection: close\r\n\r\n')
+
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+
+        positions = [data.find('<{0}>'.format(i).encode('ascii'))
+                     for i in range(10)]
+        self.assertNotIn(-1, positions)
+        self.assertEqual(positions, sorted(positions))
+        self.assertTrue(data.endswith(b'Connection: close\r\n\r\n[]'))
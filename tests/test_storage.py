@@ -0,0 +1,404 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from mock_services import storage
+from mock_services.json_codec import get_codec
+from mock_services.exceptions import Http400
+from mock_services.exceptions import Http404
+from mock_services.exceptions import Http409
+from mock_services.exceptions import Http500
+from mock_services.service import ResourceContext
+from mock_services.shared_storage import SharedStorage
+from mock_services.shared_storage import start_storage_server
+from mock_services.sqlite_storage import SqliteStorage
+
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        storage.reset()
+        storage.set_cache_bodies(False)
+        storage.set_concurrent(False)
+
+    tearDown = setUp
+
+    def test_crud(self):
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api',
+                              id=1)
+
+        self.assertRaises(Http404, storage.get, ctx)
+
+        self.assertEqual(storage.add(ctx, {'id': 1}), {'id': 1})
+        self.assertRaises(Http409, storage.add, ctx, {'id': 1})
+
+        self.assertEqual(storage.update(ctx, {'foo': 'bar'}),
+                         {'id': 1, 'foo': 'bar'})
+        self.assertEqual(storage.get(ctx), {'id': 1, 'foo': 'bar'})
+        self.assertEqual(storage.to_list(ctx), [{'id': 1, 'foo': 'bar'}])
+
+        storage.remove(ctx)
+        self.assertRaises(Http404, storage.remove, ctx)
+        self.assertEqual(storage.to_list(ctx), [])
+
+    def test_cache_bodies(self):
+
+        storage.set_cache_bodies(True)
+
+        codec = get_codec('json')
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        ctx = ResourceContext(hostname='my_fake_service', resource='api',
+                              id=1)
+
+        storage.add(ctx, {'id': 1})
+
+        body = storage.get_json(ctx, codec)
+        self.assertEqual(body, b'{"id": 1}')
+        self.assertTrue(storage.get_json(ctx, codec) is body)
+
+        body = storage.to_list_json(api, codec, limit=1)
+        self.assertEqual(body, b'[{"id": 1}]')
+        self.assertTrue(storage.to_list_json(api, codec, limit=1) is body)
+        self.assertEqual(storage.to_list_json(api, codec, offset=1), b'[]')
+
+        storage.update(ctx, {'foo': 'bar'})
+        self.assertEqual(storage.get_json(ctx, codec),
+                         b'{"id": 1, "foo": "bar"}')
+        self.assertEqual(storage.to_list_json(api, codec, limit=1),
+                         b'[{"id": 1, "foo": "bar"}]')
+
+        storage.remove(ctx)
+        self.assertRaises(Http404, storage.get_json, ctx, codec)
+        self.assertEqual(storage.to_list_json(api, codec, limit=1), b'[]')
+
+    def test_indexes(self):
+
+        def ctx(id=None):
+            return ResourceContext(hostname='my_fake_service',
+                                   resource='api', id=id)
+
+        storage.add(ctx(1), {'id': 1, 'status': 'new'})
+        storage.add(ctx(2), {'id': 2, 'status': 'done'})
+
+        # built from stored resources
+        storage.ensure_indexes(ctx(), ['status', 'email'])
+
+        storage.add(ctx(3), {'id': 3, 'status': 'new', 'email': 'a@b.c'})
+        storage.update(ctx(1), {'status': 'done'})
+        storage.remove(ctx(2))
+
+        index = storage._storage._indexes[ctx().key]
+        self.assertEqual(sorted(index['status']), ['done', 'new'])
+        self.assertEqual(list(index['status']['done']), ['1'])
+        self.assertEqual(list(index['email']['null']), ['1'])
+
+        self.assertEqual(storage.to_list(ctx(), filters={'status': 'new'}),
+                         [{'id': 3, 'status': 'new', 'email': 'a@b.c'}])
+        self.assertEqual(storage.to_list(ctx(), filters={
+            'status': 'done',
+            'email': 'a@b.c',
+        }), [])
+        self.assertEqual(storage.to_list(ctx(), filters={'status': 'none'}),
+                         [])
+
+    def test_indexes_order(self):
+
+        def ctx(id=None):
+            return ResourceContext(hostname='my_fake_service',
+                                   resource='api', id=id)
+
+        storage.add(ctx(1), {'id': 1, 'status': 'done'})
+        storage.ensure_indexes(ctx(), ['status'])
+        storage.add(ctx(2), {'id': 2, 'status': 'new'})
+        storage.seed(ctx(), [{'id': 3, 'status': 'new'}])
+
+        storage.update(ctx(2), {'foo': 'bar'})
+        storage.update(ctx(1), {'status': 'new'})
+
+        ids = [item['id'] for item in storage.to_list(ctx())]
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual([item['id'] for item in storage.to_list(
+            ctx(), filters={'status': 'new'})], ids)
+
+    def test_seed(self):
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.ensure_indexes(api, ['status'])
+
+        count = storage.seed(api, ({'id': i, 'status': 'new'}
+                                   for i in range(3000)))
+        self.assertEqual(count, 3000)
+        self.assertEqual(len(storage.to_list(api)), 3000)
+        self.assertEqual(
+            storage.get(ResourceContext(hostname='my_fake_service',
+                                        resource='api', id=42)),
+            {'id': 42, 'status': 'new'})
+        self.assertEqual(
+            len(storage.to_list(api, filters={'status': 'new'})), 3000)
+
+        self.assertRaises(Http409, storage.seed, api, [{'id': 1}])
+
+        # new ids
+        other = ResourceContext(hostname='my_fake_service', resource='other')
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(json.dumps({'foo': i}) for i in range(3)))
+            f.write('\n\n')
+
+        self.assertEqual(storage.seed_file(other, path, id_factory=int), 3)
+        self.assertEqual(storage.to_list(other), [
+            {'id': 1, 'foo': 0},
+            {'id': 2, 'foo': 1},
+            {'id': 3, 'foo': 2},
+        ])
+        self.assertEqual(storage.next_id(int, ctx=other), 4)
+
+    def test_seed_sequence(self):
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.seed(api, [{'id': 3}, {'id': 'foo'}, {'id': 2}])
+        self.assertEqual(storage.next_id(int, ctx=api), 4)
+
+        # not moved back
+        storage.seed(api, [{'id': 1}])
+        self.assertEqual(storage.next_id(int, ctx=api), 5)
+
+        other = ResourceContext(hostname='my_fake_service', resource='other')
+        storage.seed(other, [{}, {}], id_factory=int)
+        self.assertEqual(storage.next_id(int, ctx=other), 3)
+
+    def test_seed_invalid(self):
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.ensure_indexes(api, ['status'])
+        storage.seed(api, [{'id': 0, 'status': 'new'}])
+
+        items = [{'id': i, 'status': 'new'} for i in range(1, 2000)]
+        items.append({'status': 'new'})
+        with self.assertRaises(Http400) as cm:
+            storage.seed(api, items)
+        self.assertIn('"id"', str(cm.exception))
+
+        # nothing seeded
+        self.assertEqual(storage.to_list(api), [{'id': 0, 'status': 'new'}])
+        self.assertEqual(storage.to_list(api, filters={'status': 'new'}),
+                         [{'id': 0, 'status': 'new'}])
+
+        self.assertRaises(Http409, storage.seed, api,
+                          [{'id': 1}, {'id': 0}])
+        self.assertEqual(len(storage.to_list(api)), 1)
+
+    def test_iter_list(self):
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.seed(api, ({'id': i, 'status': 'new' if i % 2 else 'done'}
+                           for i in range(10)))
+
+        for query in [{}, {'limit': 3, 'offset': 2}, {'sort': '-id'},
+                      {'filters': {'status': 'new'}, 'offset': 1}]:
+            self.assertEqual(list(storage.iter_list(api, **query)),
+                             storage.to_list(api, **query))
+
+    def test_snapshot(self):
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+
+        def ctx(id):
+            return ResourceContext(hostname='my_fake_service',
+                                   resource='api', id=id)
+
+        storage.add(ctx(1), {'id': 1, 'status': 'new'})
+        storage.ensure_indexes(api, ['status'])
+
+        snapshot = storage.snapshot()
+
+        storage.update(ctx(1), {'status': 'done'})
+        storage.add(ctx(2), {'id': 2, 'status': 'new'})
+        self.assertEqual(storage.to_list(api, filters={'status': 'new'}),
+                         [{'id': 2, 'status': 'new'}])
+
+        storage.restore(snapshot)
+        self.assertEqual(storage.to_list(api), [{'id': 1, 'status': 'new'}])
+        self.assertEqual(storage.to_list(api, filters={'status': 'new'}),
+                         [{'id': 1, 'status': 'new'}])
+        self.assertEqual(storage.next_id(int, ctx=api), 1)
+
+    def test_next_id(self):
+
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        other = ResourceContext(hostname='my_fake_service', resource='other')
+
+        self.assertEqual(storage.next_id(int, ctx=api), 1)
+        self.assertEqual(storage.next_id(int, ctx=api), 2)
+
+        # sequences are kept by resource
+        self.assertEqual(storage.next_id(int, ctx=other), 1)
+
+        self.assertEqual(storage.reserve_ids(int, 3, ctx=api), [3, 4, 5])
+        self.assertEqual(storage.next_id(int, ctx=api), 6)
+
+        self.assertRaises(Http500, storage.next_id, 'user', ctx=api)
+
+        storage.register_id_factory('user', 'user_{0}'.format)
+        self.assertEqual(storage.next_id('user', ctx=api), 'user_7')
+
+        storage.reset()
+        self.assertEqual(storage.next_id('user', ctx=api), 'user_1')
+
+    def test_concurrent(self):
+
+        storage.set_concurrent(True)
+
+        conflicts = []
+
+        def add_all():
+            for i in range(200):
+                ctx = ResourceContext(hostname='my_fake_service',
+                                      resource='api', id=i)
+                try:
+                    storage.add(ctx, {'id': i})
+                except Http409:
+                    conflicts.append(i)
+
+        threads = [threading.Thread(target=add_all) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # every id has been added once only
+        ctx = ResourceContext(hostname='my_fake_service', resource='api')
+        self.assertEqual(len(storage.to_list(ctx)), 200)
+        self.assertEqual(len(conflicts), 200 * 7)
+
+
+class SqliteStorageTestCase(StorageTestCase):
+
+    def setUp(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        self.addCleanup(storage.set_backend, storage.get_backend())
+        storage.set_backend(SqliteStorage(path))
+
+    def tearDown(self):
+        pass
+
+    @unittest.skip('bodies are stored encoded')
+    def test_cache_bodies(self):
+        pass
+
+    @unittest.skip('indexes are stored in the database')
+    def test_indexes(self):
+        pass
+
+    def test_persistent(self):
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api',
+                              id=1)
+        storage.add(ctx, {'id': 1, 'foo': 'bar'})
+        self.assertEqual(storage.get_json(ctx, get_codec()),
+                         b'{"id": 1, "foo": "bar"}')
+
+        # read back from the file
+        backend = SqliteStorage(storage.get_backend().path)
+        self.assertEqual(backend.get(ctx), {'id': 1, 'foo': 'bar'})
+        self.assertRaises(Http409, backend.add, ctx, {'id': 1})
+
+    def test_snapshot_file(self):
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api',
+                              id=1)
+        storage.add(ctx, {'id': 1})
+
+        # not kept in memory
+        snapshot = storage.snapshot()
+        self.assertTrue(os.path.exists(snapshot.path))
+        self.assertEqual(os.path.dirname(snapshot.path),
+                         os.path.dirname(storage.get_backend().path))
+
+        storage.remove(ctx)
+        storage.restore(snapshot)
+        self.assertEqual(storage.get(ctx), {'id': 1})
+
+        snapshot.close()
+        self.assertFalse(os.path.exists(snapshot.path))
+
+    def test_iter_list_concurrent(self):
+
+        storage.set_concurrent(True)
+        api = ResourceContext(hostname='my_fake_service', resource='api')
+        storage.seed(api, ({'id': i} for i in range(1, 3001)))
+
+        items = storage.iter_list(api)
+        self.assertEqual(next(items), {'id': 1})
+
+        # the connection lock is not held between batches
+        lock = storage.get_backend()._get_lock(api.key)
+        acquired = []
+
+        def try_lock():
+            if lock.acquire(False):
+                acquired.append(True)
+                lock.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        self.assertEqual(acquired, [True])
+
+        self.assertEqual(len(list(items)), 2999)
+
+
+def add_from_process(address, authkey, id):
+    backend = SharedStorage(address, authkey)
+    backend.add(ResourceContext(hostname='my_fake_service', resource='api',
+                                id=id), {'id': id})
+
+
+class SharedStorageTestCase(StorageTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.authkey = b'mock-services'
+        cls.manager = start_storage_server(authkey=cls.authkey)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.manager.shutdown()
+
+    def setUp(self):
+        self.addCleanup(storage.set_backend, storage.get_backend())
+        storage.set_backend(SharedStorage(self.manager.address, self.authkey))
+        super(SharedStorageTestCase, self).setUp()
+
+    def tearDown(self):
+        storage.reset()
+
+    @unittest.skip('bodies are cached by the server')
+    def test_cache_bodies(self):
+        pass
+
+    @unittest.skip('indexes are kept by the server')
+    def test_indexes(self):
+        pass
+
+    def test_processes(self):
+
+        ctx = ResourceContext(hostname='my_fake_service', resource='api',
+                              id=1)
+
+        process = multiprocessing.Process(
+            target=add_from_process, args=(self.manager.address,
+                                           self.authkey, 1))
+        process.start()
+        process.join()
+
+        self.assertEqual(storage.get(ctx), {'id': 1})
+        self.assertRaises(Http409, storage.add, ctx, {'id': 1})